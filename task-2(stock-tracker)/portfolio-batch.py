@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Portfolio Batch Valuation
+
+Values many portfolio files without the GUI. Every symbol is quoted once, no
+matter how many portfolios hold it, and each portfolio's valuation is streamed
+to stdout as CSV or JSON lines as soon as all of its quotes are in.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+
+import portfolio_analytics
+import portfolio_core
+
+VALUATION_FIELDS = [
+    "portfolio", "symbol", "name", "shares", "buy_price", "price",
+    "value", "cost", "gain_loss", "gain_loss_pct"
+]
+ANALYTICS_FIELDS = ["weight", "volatility", "max_drawdown", "beta", "var"]
+
+
+class ValuationWriter:
+    """Streams valuation rows to a file object as CSV or JSON lines."""
+    
+    def __init__(self, stream, output_format, fields):
+        self.stream = stream
+        self.output_format = output_format
+        self.fields = fields
+        if output_format == "csv":
+            self.writer = csv.DictWriter(stream, fieldnames=fields, extrasaction="ignore")
+            self.writer.writeheader()
+    
+    def write(self, rows):
+        for row in rows:
+            if self.output_format == "csv":
+                self.writer.writerow(row)
+            else:
+                self.stream.write(json.dumps({field: row.get(field) for field in self.fields}) + "\n")
+        self.stream.flush()
+
+
+def _finite(value):
+    """Convert NaN to None so it is written as an empty field / JSON null."""
+    value = float(value)
+    return None if value != value else value
+
+
+def valuation_rows(name, ledger, quotes, analytics=None):
+    """Build the position rows and the TOTAL row of one portfolio.
+    
+    Args:
+        name (str): Portfolio name written in the first column
+        ledger (PortfolioLedger): The portfolio
+        quotes (dict): Latest price per symbol
+        analytics (tuple): Optional result of portfolio_analytics.analyze_holdings
+    
+    Returns:
+        list: Row dicts
+    """
+    per_symbol, summary = analytics if analytics is not None else (None, None)
+    rows = []
+    total_value = 0.0
+    total_cost = 0.0
+    
+    for row in portfolio_core.value_positions(ledger, quotes):
+        row["portfolio"] = name
+        if per_symbol is not None and row["symbol"] in per_symbol.index:
+            stats = per_symbol.loc[row["symbol"]]
+            for field in ("weight", "volatility", "max_drawdown", "beta"):
+                row[field] = _finite(stats[field])
+        total_value += row["value"]
+        total_cost += row["cost"]
+        rows.append(row)
+    
+    gain_loss = total_value - total_cost
+    total = {
+        "portfolio": name,
+        "symbol": "TOTAL",
+        "value": total_value,
+        "cost": total_cost,
+        "gain_loss": gain_loss,
+        "gain_loss_pct": (gain_loss / total_cost) * 100 if total_cost > 0 else 0.0,
+    }
+    if summary is not None:
+        total["weight"] = 1.0
+        total["volatility"] = _finite(summary["volatility"])
+        total["max_drawdown"] = _finite(summary["max_drawdown"])
+        total["var"] = _finite(summary["var"])
+    rows.append(total)
+    return rows
+
+
+def load_portfolios(paths, logger):
+    """Load every readable portfolio file; missing and unreadable files are logged and skipped."""
+    portfolios = []
+    for path in paths:
+        try:
+            portfolios.append((path, portfolio_core.load_portfolio_file(path)))
+        except Exception as e:
+            logger.error(f"Error loading {path}: {str(e)}")
+    return portfolios
+
+
+def main():
+    """Main entry point for the script."""
+    parser = argparse.ArgumentParser(description="Value many portfolio files without the GUI.")
+    parser.add_argument("files", nargs="+", help="Portfolio files (portfolio.db or legacy portfolio.json)")
+    parser.add_argument("-f", "--format", choices=("csv", "json"), default="csv", help="Output format: CSV or JSON lines (default: csv)")
+    parser.add_argument("--analytics", action="store_true", help="Add volatility, drawdown, beta and VaR columns")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes used for the analytics step (default: all cores)")
+    parser.add_argument("--offline", action="store_true", help="Don't call the API; use stored prices and history only")
+    parser.add_argument("--api-key", default=os.environ.get("ALPHAVANTAGE_API_KEY"), help="Alpha Vantage API key (default: $ALPHAVANTAGE_API_KEY)")
+    parser.add_argument("--calls-per-minute", type=int, default=portfolio_core.API_CALLS_PER_MINUTE, help="API calls allowed per minute (0 = unlimited)")
+    parser.add_argument("--calls-per-day", type=int, default=portfolio_core.API_CALLS_PER_DAY, help="API calls allowed per day (0 = unlimited)")
+    parser.add_argument("--batch-size", type=int, default=portfolio_core.BATCH_QUOTE_SIZE, help="Symbols per bulk quote request (0 = one request per symbol)")
+    parser.add_argument("--metrics", metavar="PATH", help="Write timings and API/cache counters to PATH when done (.json for JSON, else Prometheus text)")
+    parser.add_argument("--history-db", default=portfolio_core.PRICE_HISTORY_DB, help="Price history database used for analytics")
+    args = parser.parse_args()
+    
+    # stdout carries the data; diagnostics go to stderr
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s", stream=sys.stderr)
+    logger = logging.getLogger("portfolio-batch")
+    
+    if not args.offline and not args.api_key:
+        parser.error("an API key is required (--api-key or $ALPHAVANTAGE_API_KEY), or use --offline")
+    
+    portfolios = load_portfolios(args.files, logger)
+    if not portfolios:
+        return 1
+    failed = len(args.files) - len(portfolios)
+    
+    # Which portfolios hold each symbol, so each symbol is fetched once
+    holders = {}
+    for index, (path, ledger) in enumerate(portfolios):
+        for symbol in ledger.positions:
+            holders.setdefault(symbol, []).append(index)
+    logger.info(f"{len(portfolios)} portfolios, {len(holders)} distinct symbols")
+    
+    client = None
+    if not args.offline:
+        client = portfolio_core.AlphaVantageClient(
+            args.api_key, args.calls_per_minute, args.calls_per_day,
+            price_history=portfolio_core.PriceHistoryStore(args.history_db),
+            batch_size=args.batch_size
+        )
+    
+    # Analytics run in worker processes while quotes are being fetched
+    analytics = [None] * len(portfolios)
+    executor = None
+    if args.analytics:
+        if client is not None:
+            logger.info("Syncing price history")
+            for symbol, bars in client.history_engine.refresh(holders):
+                pass
+        
+        if args.workers > 1 and len(portfolios) > 1:
+            executor = ProcessPoolExecutor(max_workers=args.workers)
+        for index, (path, ledger) in enumerate(portfolios):
+            shares = {position.symbol: position.shares for position in ledger}
+            current_prices = {position.symbol: position.price for position in ledger}
+            job = partial(portfolio_analytics.analyze_holdings, shares, args.history_db,
+                          portfolio_core.ANALYTICS_DAYS, current_prices=current_prices)
+            if executor is not None:
+                analytics[index] = executor.submit(job)
+            else:
+                analytics[index] = job
+    
+    fields = VALUATION_FIELDS + (ANALYTICS_FIELDS if args.analytics else [])
+    writer = ValuationWriter(sys.stdout, args.format, fields)
+    quotes = {}
+    
+    def emit(index):
+        path, ledger = portfolios[index]
+        result = analytics[index]
+        try:
+            if isinstance(result, Future):
+                result = result.result()
+            elif result is not None:
+                result = result()
+        except Exception as e:
+            logger.error(f"Error computing analytics for {path}: {str(e)}")
+            result = None
+        writer.write(valuation_rows(path, ledger, quotes, result))
+    
+    try:
+        # Portfolios with nothing to fetch can be written right away
+        remaining = [len(ledger) for path, ledger in portfolios]
+        for index, count in enumerate(remaining):
+            if count == 0 or client is None:
+                emit(index)
+        
+        if client is not None:
+            for done, (symbol, stock_data) in enumerate(client.refresh_quotes(holders), 1):
+                if stock_data:
+                    quotes[symbol] = stock_data["price"]
+                if done % 100 == 0:
+                    logger.info(f"Quotes: {done}/{len(holders)}")
+                
+                for index in holders[symbol]:
+                    remaining[index] -= 1
+                    if remaining[index] == 0:
+                        emit(index)
+            client.metadata_cache.save()
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if args.metrics:
+            portfolio_core.metrics.export(args.metrics)
+    
+    if failed:
+        logger.error(f"{failed} of {len(args.files)} portfolio files could not be read")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
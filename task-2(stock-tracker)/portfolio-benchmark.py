@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Portfolio Benchmark
+
+End-to-end performance measurements of the tracker against the offline replay
+provider. For synthetic portfolios of several sizes it measures refresh wall
+time, time spent updating the UI on the Tk thread, and memory. Results can be
+saved and compared against an earlier run to catch regressions.
+"""
+
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import portfolio_core
+from portfolio_replay import FixtureSet, ReplayProvider, ReplayServer
+
+DEFAULT_SIZES = [10, 1000, 10000]
+
+# Metrics where a higher value is a regression when comparing with a baseline
+COMPARED_METRICS = ["refresh_seconds", "peak_memory_bytes", "ui_initial_seconds", "ui_refresh_seconds", "save_seconds"]
+
+# Spans that make up the Tk-thread work of a refresh
+UI_SPANS = ["apply_quote", "update_summary", "chart_flush", "canvas_draw"]
+
+
+def synthetic_symbols(count):
+    """count distinct ticker-like symbols"""
+    return [f"S{i:05d}" for i in range(count)]
+
+
+def span_total(snapshot, names):
+    return sum(snapshot['spans'].get(name, {}).get('total', 0.0) for name in names)
+
+
+def counter_total(snapshot, name):
+    return sum(counter['value'] for counter in snapshot['counters'] if counter['name'] == name)
+
+
+def make_client(provider, workdir, args):
+    """Client with unlimited local budget; throttling, if any, comes from the provider"""
+    return portfolio_core.AlphaVantageClient(
+        "benchmark", 0, 0, args.workers,
+        metadata_cache=portfolio_core.MetadataCache(os.path.join(workdir, "metadata_cache.json")),
+        price_history=portfolio_core.PriceHistoryStore(os.path.join(workdir, "price_history.db")),
+        batch_size=args.batch_size,
+        provider=provider
+    )
+
+
+def measure_refresh(client, symbols):
+    """Wall time, request count and peak traced memory of refreshing every symbol"""
+    portfolio_core.metrics.reset()
+    start = time.perf_counter()
+    quotes = sum(1 for symbol, data in client.refresh_quotes(symbols) if data)
+    elapsed = time.perf_counter() - start
+    requests = counter_total(portfolio_core.metrics.snapshot(), 'api_calls')
+    
+    # Separate pass for memory, since tracing slows everything down
+    tracemalloc.start()
+    for symbol, data in client.refresh_quotes(symbols):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    
+    return {
+        'refresh_seconds': elapsed,
+        'requests': requests,
+        'quotes': quotes,
+        'peak_memory_bytes': peak,
+    }
+
+
+def load_tracker():
+    """Import stock-portfolio-tracker.py (not importable by name because of the hyphens)"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stock-portfolio-tracker.py")
+    spec = importlib.util.spec_from_file_location("stock_portfolio_tracker", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure_ui(tracker, client, symbols):
+    """Tk-thread time to build the table and charts, and to apply a full refresh"""
+    import tkinter as tk
+    
+    root = tk.Tk()
+    root.withdraw()
+    app = tracker.StockPortfolioTracker(root, client=client)
+    app.scheduler.stop()
+    try:
+        # The charts are created asynchronously after startup
+        while app.charts is None:
+            root.update()
+            time.sleep(0.001)
+        
+        for symbol in symbols:
+            app.portfolio.add_lot(symbol, 10, 100.0, name=symbol, current_price=100.0)
+        
+        # First render of the whole portfolio
+        portfolio_core.metrics.reset()
+        start = time.perf_counter()
+        app.update_portfolio_display()
+        app.charts.flush()
+        root.update()
+        ui_initial = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        app.save_portfolio()
+        save = time.perf_counter() - start
+        
+        # Refresh through the normal worker thread -> UI queue path
+        app.apply_quote = portfolio_core.metrics.timed('apply_quote')(app.apply_quote)
+        portfolio_core.metrics.reset()
+        done = []
+        app.run_in_background(app.fetch_quotes, lambda result, cancelled: done.append(result), symbols)
+        while not done:
+            root.update()
+            time.sleep(0.001)
+        app.charts.flush()
+        root.update()
+        ui_refresh = span_total(portfolio_core.metrics.snapshot(), UI_SPANS)
+    finally:
+        app.portfolio_store.conn.close()
+        root.destroy()
+    
+    return {
+        'ui_initial_seconds': ui_initial,
+        'ui_refresh_seconds': ui_refresh,
+        'save_seconds': save,
+    }
+
+
+def run_size(count, provider, tracker, args):
+    """All measurements for one synthetic portfolio size"""
+    symbols = synthetic_symbols(count)
+    workdir = tempfile.mkdtemp(prefix="portfolio-benchmark-")
+    cwd = os.getcwd()
+    
+    # The tracker keeps portfolio.db and its caches in the working directory
+    os.chdir(workdir)
+    try:
+        result = {'holdings': count}
+        result.update(measure_refresh(make_client(provider, workdir, args), symbols))
+        if tracker is not None:
+            result.update(measure_ui(tracker, make_client(provider, workdir, args), symbols))
+    finally:
+        os.chdir(cwd)
+    
+    result['max_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Return a message per metric that got worse than baseline by more than tolerance"""
+    previous = {entry['holdings']: entry for entry in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get(result['holdings'])
+        if before is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if metric in result and before.get(metric):
+                if result[metric] > before[metric] * (1 + tolerance):
+                    regressions.append(
+                        f"{result['holdings']} holdings: {metric} {result[metric]:.4g} vs baseline {before[metric]:.4g}"
+                    )
+    return regressions
+
+
+def main():
+    """Main entry point for the script."""
+    parser = argparse.ArgumentParser(description="Benchmark portfolio refresh and UI updates against a replay provider.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Portfolio sizes to measure (default: 10 1000 10000)")
+    parser.add_argument("--fixtures", help="Directory of recorded responses (default: synthetic data only)")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds of latency added to each request (default: 0.02)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra latency per request, up to this many seconds")
+    parser.add_argument("--throttle", type=int, default=0, help="Answer with a rate-limit Note beyond this many calls per minute (0 = off)")
+    parser.add_argument("--http", action="store_true", help="Serve the replay over a local HTTP server instead of in-process")
+    parser.add_argument("--workers", type=int, default=portfolio_core.REFRESH_WORKERS, help="Concurrent requests per refresh")
+    parser.add_argument("--batch-size", type=int, default=portfolio_core.BATCH_QUOTE_SIZE, help="Symbols per bulk quote request (0 = one request per symbol)")
+    parser.add_argument("--no-ui", action="store_true", help="Skip the Tk measurements")
+    parser.add_argument("-o", "--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Results file of an earlier run; exit with status 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline (default: 0.25 = 25%%)")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s", stream=sys.stderr)
+    logger = logging.getLogger("portfolio-benchmark")
+    
+    provider = ReplayProvider(FixtureSet(args.fixtures), args.latency, args.jitter, args.throttle)
+    server = None
+    if args.http:
+        server = ReplayServer(provider).start()
+        request_provider = portfolio_core.HttpProvider(server.url)
+    else:
+        request_provider = provider
+    
+    tracker = None
+    if not args.no_ui:
+        try:
+            import tkinter as tk
+            tk.Tk().destroy()
+            tracker = load_tracker()
+        except Exception as e:
+            logger.warning(f"Skipping UI measurements: {str(e)}")
+    
+    results = []
+    try:
+        for count in args.sizes:
+            result = run_size(count, request_provider, tracker, args)
+            results.append(result)
+            print(
+                f"{count:>6} holdings: refresh {result['refresh_seconds']:.3f}s "
+                f"({result['requests']} requests), peak {result['peak_memory_bytes'] / 1e6:.1f} MB"
+                + (
+                    f", UI initial {result['ui_initial_seconds']:.3f}s, UI refresh {result['ui_refresh_seconds']:.3f}s, "
+                    f"save {result['save_seconds']:.3f}s" if 'ui_initial_seconds' in result else ""
+                ),
+                file=sys.stderr
+            )
+    finally:
+        if server is not None:
+            server.stop()
+    
+    report = {
+        'settings': {
+            'latency': args.latency, 'jitter': args.jitter, 'throttle': args.throttle, 'http': args.http,
+            'workers': args.workers, 'batch_size': args.batch_size, 'fixtures': args.fixtures,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            logger.error(f"Regression: {message}")
+        if regressions:
+            return 1
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
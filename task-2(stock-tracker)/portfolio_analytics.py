@@ -0,0 +1,273 @@
+"""
+Portfolio Analytics
+
+Vectorized risk and return statistics for a portfolio, computed from the daily
+closes kept in the local price history store.
+"""
+
+import sqlite3
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS_PER_YEAR = 252
+
+# SQLite limits the number of bound parameters per statement
+SQL_PARAM_CHUNK = 900
+
+
+def load_close_prices(conn, symbols, start=None):
+    """Load daily closes for symbols into a date x symbol DataFrame
+    
+    Args:
+        conn (sqlite3.Connection): Connection to the price history database
+        symbols (list): Symbols to load (columns of the result, in this order)
+        start (str): Optional first date (YYYY-MM-DD) to load
+    
+    Returns:
+        DataFrame: Closes indexed by date, NaN where a symbol has no bar
+    """
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return pd.DataFrame()
+    
+    # Rows go straight from the cursor into structured arrays, one per chunk
+    width = max(len(symbol) for symbol in symbols)
+    dtype = np.dtype([('date', 'U10'), ('symbol', f'U{width}'), ('close', 'f8')])
+    parts = []
+    for i in range(0, len(symbols), SQL_PARAM_CHUNK):
+        chunk = symbols[i:i + SQL_PARAM_CHUNK]
+        query = (
+            "SELECT date, symbol, close FROM daily_bars "
+            f"WHERE symbol IN ({','.join('?' * len(chunk))})"
+        )
+        params = list(chunk)
+        if start:
+            query += " AND date >= ?"
+            params.append(start)
+        parts.append(np.fromiter(conn.execute(query, params), dtype=dtype))
+    bars = np.concatenate(parts)
+    
+    # Pivot to date x symbol by scattering each close into its cell
+    dates, rows = np.unique(bars['date'], return_inverse=True)
+    order = np.argsort(symbols)
+    ranked = np.array(symbols)[order]
+    columns = order[np.searchsorted(ranked, bars['symbol'])]
+    values = np.full((len(dates), len(symbols)), np.nan)
+    values[rows, columns] = bars['close']
+    
+    return pd.DataFrame(values, index=pd.DatetimeIndex(dates.astype('datetime64[D]')), columns=symbols)
+
+
+def daily_returns(prices):
+    """Simple daily returns; a missing close gives a missing return"""
+    values = prices.to_numpy(dtype=float)
+    returns = values[1:] / values[:-1] - 1.0
+    return pd.DataFrame(returns, index=prices.index[1:], columns=prices.columns)
+
+
+def volatility(returns, periods=TRADING_DAYS_PER_YEAR):
+    """Annualized standard deviation of each column of returns"""
+    return returns.std(ddof=1) * np.sqrt(periods)
+
+
+def max_drawdown(prices):
+    """Largest peak-to-trough decline of each column, as a negative fraction"""
+    values = prices.to_numpy(dtype=float)
+    if values.shape[0] == 0:
+        return pd.Series(np.nan, index=prices.columns)
+    
+    # fmax ignores NaN, so gaps in the history don't reset the running peak
+    peaks = np.fmax.accumulate(values, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        drawdowns = values / peaks - 1.0
+    
+    # Columns without any close stay NaN (nanmin would warn about them)
+    result = np.full(values.shape[1], np.nan)
+    has_data = ~np.isnan(values).all(axis=0)
+    if has_data.any():
+        result[has_data] = np.nanmin(drawdowns[:, has_data], axis=0)
+    return pd.Series(result, index=prices.columns)
+
+
+def _pairwise_correlation(a, b):
+    """Correlation of every column of a with every column of b over the days both have data"""
+    mask_a = ~np.isnan(a)
+    mask_b = ~np.isnan(b)
+    valid_a = mask_a.astype(float)
+    valid_b = mask_b.astype(float)
+    x = np.where(mask_a, a, 0.0)
+    y = np.where(mask_b, b, 0.0)
+    
+    # Pairwise-complete sums as matrix products instead of a per-pair loop
+    counts = valid_a.T @ valid_b
+    sums_x = x.T @ valid_b
+    sums_y = valid_a.T @ y
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = x.T @ y - sums_x * sums_y / counts
+        variance_x = (x * x).T @ valid_b - sums_x * sums_x / counts
+        variance_y = valid_a.T @ (y * y) - sums_y * sums_y / counts
+        corr = covariance / np.sqrt(variance_x * variance_y)
+    corr[counts < 2] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+def correlation_matrix(returns):
+    """Pairwise correlation of returns, using the days both columns have data"""
+    values = returns.to_numpy(dtype=float)
+    columns = values.shape[1]
+    corr = np.full((columns, columns), np.nan)
+    
+    # Columns without gaps take the dense path; only the others need pairwise sums
+    complete = ~np.isnan(values).any(axis=0)
+    if values.shape[0] > 1 and complete.sum() > 1:
+        corr[np.ix_(complete, complete)] = np.corrcoef(values[:, complete], rowvar=False)
+    
+    partial = np.flatnonzero(~complete)
+    if partial.size:
+        block = _pairwise_correlation(values[:, partial], values)
+        corr[partial, :] = block
+        corr[:, partial] = block.T
+    
+    return pd.DataFrame(corr, index=returns.columns, columns=returns.columns)
+
+
+def beta(returns, benchmark_returns):
+    """Beta of each column of returns against a benchmark return series"""
+    benchmark = benchmark_returns.reindex(returns.index).to_numpy(dtype=float)
+    values = returns.to_numpy(dtype=float)
+    
+    # Only use days where both the stock and the benchmark have a return
+    mask = ~np.isnan(values) & ~np.isnan(benchmark)[:, None]
+    counts = mask.sum(axis=0)
+    bench = np.where(mask, benchmark[:, None], 0.0)
+    stock = np.where(mask, values, 0.0)
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        bench_mean = bench.sum(axis=0) / counts
+        stock_mean = stock.sum(axis=0) / counts
+        covariance = (np.where(mask, (stock - stock_mean) * (bench - bench_mean), 0.0)).sum(axis=0) / (counts - 1)
+        variance = (np.where(mask, (bench - bench_mean) ** 2, 0.0)).sum(axis=0) / (counts - 1)
+        betas = covariance / variance
+    return pd.Series(betas, index=returns.columns)
+
+
+def portfolio_returns(returns, weights):
+    """Daily returns of the weighted portfolio (missing returns count as flat)"""
+    weights = weights.reindex(returns.columns).fillna(0.0).to_numpy(dtype=float)
+    values = np.nan_to_num(returns.to_numpy(dtype=float))
+    return pd.Series(values @ weights, index=returns.index)
+
+
+def value_at_risk(returns, confidence=0.95, value=1.0, method='historical'):
+    """One-day Value at Risk of a return series, as a positive loss amount
+    
+    Args:
+        returns (Series): Daily portfolio returns
+        confidence (float): Confidence level, e.g. 0.95
+        value (float): Portfolio value the loss is expressed in
+        method (str): 'historical' (empirical quantile) or 'parametric' (normal)
+    
+    Returns:
+        float: Loss not exceeded with the given confidence
+    """
+    values = returns.dropna().to_numpy(dtype=float)
+    if values.size == 0:
+        return float('nan')
+    
+    if method == 'parametric':
+        from statistics import NormalDist
+        z = NormalDist().inv_cdf(1.0 - confidence)
+        quantile = values.mean() + z * values.std(ddof=1)
+    else:
+        quantile = np.quantile(values, 1.0 - confidence)
+    return float(-quantile * value)
+
+
+def analyze_portfolio(shares, prices, benchmark=None, confidence=0.95, current_prices=None):
+    """Compute per-holding and portfolio-level risk statistics
+    
+    Args:
+        shares (Series): Number of shares held, indexed by symbol
+        prices (DataFrame): Daily closes (date x symbol), see load_close_prices
+        benchmark (str): Column of prices to measure beta against; the
+            portfolio itself is used when None or not available
+        confidence (float): Confidence level for Value at Risk
+        current_prices (dict): Optional current price per symbol, weighting
+            holdings that have no stored closes at their market value
+    
+    Returns:
+        tuple: (DataFrame of per-symbol statistics, dict of portfolio statistics)
+    """
+    benchmark_prices = None
+    if benchmark is not None and benchmark in prices.columns:
+        benchmark_prices = prices[[benchmark]]
+    
+    prices = prices.reindex(columns=shares.index)
+    returns = daily_returns(prices)
+    
+    # Weights from the latest known close of each holding
+    last_prices = prices.ffill().iloc[-1] if len(prices) else pd.Series(np.nan, index=shares.index)
+    if current_prices is not None:
+        last_prices = last_prices.fillna(pd.Series(current_prices, dtype=float).reindex(shares.index))
+    values = (shares * last_prices).fillna(0.0)
+    total_value = float(values.sum())
+    weights = values / total_value if total_value > 0 else values
+    
+    combined = portfolio_returns(returns, weights)
+    if benchmark_prices is not None:
+        benchmark_returns = daily_returns(benchmark_prices).iloc[:, 0]
+    else:
+        benchmark_returns = combined
+    
+    per_symbol = pd.DataFrame({
+        'weight': weights,
+        'volatility': volatility(returns),
+        'max_drawdown': max_drawdown(prices),
+        'beta': beta(returns, benchmark_returns),
+    })
+    
+    # Cumulative portfolio value path for the portfolio drawdown
+    growth = (1.0 + combined).cumprod().to_frame('portfolio')
+    summary = {
+        'value': total_value,
+        'volatility': float(volatility(combined.to_frame()).iloc[0]) if len(combined) > 1 else float('nan'),
+        'max_drawdown': float(max_drawdown(growth).iloc[0]) if len(growth) else float('nan'),
+        'var': value_at_risk(combined, confidence, total_value),
+        'confidence': confidence,
+        'days': len(prices),
+        'correlation': correlation_matrix(returns),
+    }
+    return per_symbol, summary
+
+
+def analyze_holdings(shares, db_path, days=TRADING_DAYS_PER_YEAR, benchmark=None, confidence=0.95,
+                     current_prices=None):
+    """Analyze holdings over their last `days` trading days of stored closes
+    
+    Opens its own database connection, so it can run in a worker process.
+    
+    Args:
+        shares (dict): Number of shares held per symbol
+        db_path (str): Path of the price history database
+        days (int): Number of trading days of history to use
+        benchmark (str): Optional benchmark symbol for beta
+        confidence (float): Confidence level for Value at Risk
+        current_prices (dict): Optional current price per symbol, see analyze_portfolio
+    
+    Returns:
+        tuple: See analyze_portfolio
+    """
+    # Calendar days covering the requested trading days, plus a margin for holidays
+    start = (date.today() - timedelta(days=days * 7 // 5 + 7)).isoformat()
+    symbols = list(shares) + ([benchmark] if benchmark else [])
+    
+    conn = sqlite3.connect(db_path)
+    try:
+        prices = load_close_prices(conn, symbols, start)
+    finally:
+        conn.close()
+    
+    prices = prices.iloc[-(days + 1):]
+    return analyze_portfolio(pd.Series(shares, dtype=float), prices, benchmark, confidence, current_prices)
@@ -0,0 +1,1407 @@
+"""
+Portfolio Core
+
+GUI-free parts of the stock portfolio tracker: rate-limited and cached Alpha
+Vantage access, the multi-lot portfolio ledger and its storage, and the local
+price history store. Used by the Tk application and the batch valuation CLI.
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Alpha Vantage endpoint and free tier limits
+ALPHA_VANTAGE_URL = 'https://www.alphavantage.co/query'
+API_CALLS_PER_MINUTE = 5
+API_CALLS_PER_DAY = 500
+
+# Number of quotes fetched in parallel during a refresh
+REFRESH_WORKERS = 8
+
+# Symbols per REALTIME_BULK_QUOTES request (the API accepts up to 100); 0 disables batching
+BATCH_QUOTE_SIZE = 100
+
+# Extra attempts for a throttled bulk request, each after the rate limiter backs off
+BATCH_RETRIES = 3
+
+# Phrases of an Information reply that mean the daily/minute limit was hit
+THROTTLE_WORDING = ('rate limit', 'requests per day', 'call frequency')
+
+# Company metadata (names) cache
+METADATA_CACHE_FILE = 'metadata_cache.json'
+METADATA_TTL = 30 * 86400
+METADATA_MAX_ENTRIES = 5000
+
+# Portfolio storage; portfolio.json from older versions is imported once
+PORTFOLIO_DB = 'portfolio.db'
+LEGACY_PORTFOLIO_FILE = 'portfolio.json'
+
+# Local daily price history; a symbol is re-synced at most once per interval (s)
+PRICE_HISTORY_DB = 'price_history.db'
+HISTORY_SYNC_INTERVAL = 3600
+
+# Number of daily bars returned by outputsize=compact
+COMPACT_BARS = 100
+
+# History window (trading days) used for portfolio analytics
+ANALYTICS_DAYS = 252
+
+# Daily bars as a structured array, one record per trading day
+DAILY_BAR_DTYPE = np.dtype([
+    ('date', 'datetime64[D]'), ('open', 'f8'), ('high', 'f8'),
+    ('low', 'f8'), ('close', 'f8'), ('volume', 'i8')
+])
+
+# TIME_SERIES_DAILY responses are read in chunks of this many bytes; the first
+# PARSE_HEAD_BYTES are kept to decode an error/Note response that has no bars
+PARSE_CHUNK_BYTES = 256 * 1024
+PARSE_HEAD_BYTES = 64 * 1024
+
+# One daily bar of a TIME_SERIES_DAILY payload: "date": {"1. open": "...", ...}
+DAILY_BAR_PATTERN = re.compile(
+    rb'"(\d{4}-\d{2}-\d{2})"\s*:\s*\{\s*'
+    rb'"1\. open"\s*:\s*"([^"]*)"\s*,\s*'
+    rb'"2\. high"\s*:\s*"([^"]*)"\s*,\s*'
+    rb'"3\. low"\s*:\s*"([^"]*)"\s*,\s*'
+    rb'"4\. close"\s*:\s*"([^"]*)"\s*,\s*'
+    rb'"5\. volume"\s*:\s*"([^"]*)"\s*\}'
+)
+
+# Regular trading session of the exchange (US equities)
+MARKET_TIMEZONE = 'America/New_York'
+MARKET_OPEN = (9, 30)
+MARKET_CLOSE = (16, 0)
+
+# Background refresh: a quote is fresh for QUOTE_MAX_AGE seconds while the market
+# is open (shorter for large/volatile holdings), and the scheduler uses at most
+# SCHEDULER_BUDGET_SHARE of the API budget, leaving the rest for user actions
+QUOTE_MAX_AGE = 15 * 60
+SCHEDULER_BUDGET_SHARE = 0.5
+VOLATILITY_DAYS = 30
+
+# Position priorities follow price moves at most this often (seconds); a change
+# of the symbols held updates them right away
+PRIORITY_INTERVAL = 15 * 60
+
+# Upper bounds (seconds) of the timing histogram buckets in the Prometheus export
+SPAN_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metrics:
+    """Thread-safe counters and timing spans of the hot paths
+    
+    Counters are keyed by name and optional labels; spans keep the count,
+    total, maximum and last duration of a timed operation plus a histogram.
+    Both can be exported as JSON or Prometheus text.
+    """
+    
+    def __init__(self, buckets=SPAN_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.spans = {}
+    
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+    
+    def observe(self, name, seconds):
+        """Record one duration of the span called name"""
+        with self.lock:
+            span = self.spans.get(name)
+            if span is None:
+                span = self.spans[name] = {
+                    'count': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0,
+                    'buckets': [0] * len(self.buckets)
+                }
+            span['count'] += 1
+            span['total'] += seconds
+            span['max'] = max(span['max'], seconds)
+            span['last'] = seconds
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    span['buckets'][i] += 1
+                    break
+    
+    @contextmanager
+    def span(self, name):
+        """Time the body of a with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+    
+    def timed(self, name):
+        """Decorator timing every call of a function as the span called name"""
+        def decorator(function):
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return function(*args, **kwargs)
+            wrapper.__name__ = function.__name__
+            wrapper.__doc__ = function.__doc__
+            return wrapper
+        return decorator
+    
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.spans.clear()
+    
+    def snapshot(self):
+        """Current counters and spans as plain data (durations in seconds)"""
+        with self.lock:
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self.counters.items())
+            ]
+            spans = {
+                name: {
+                    'count': span['count'],
+                    'total': span['total'],
+                    'mean': span['total'] / span['count'],
+                    'max': span['max'],
+                    'last': span['last'],
+                }
+                for name, span in sorted(self.spans.items())
+            }
+        return {'counters': counters, 'spans': spans}
+    
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+    
+    def to_prometheus(self, prefix='portfolio_'):
+        """Prometheus text exposition format: counters as <name>_total, spans as one histogram"""
+        def format_labels(labels):
+            if not labels:
+                return ''
+            escaped = [(key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in labels]
+            return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+        
+        with self.lock:
+            counters = sorted(self.counters.items())
+            spans = sorted((name, dict(span, buckets=list(span['buckets']))) for name, span in self.spans.items())
+        
+        lines = []
+        declared = set()
+        for (name, labels), value in counters:
+            metric = f"{prefix}{name}_total"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{format_labels(labels)} {value}")
+        
+        if spans:
+            metric = f"{prefix}span_duration_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for name, span in spans:
+                cumulative = 0
+                for bound, count in zip(self.buckets, span['buckets']):
+                    cumulative += count
+                    lines.append(f"{metric}_bucket{format_labels([('span', name), ('le', repr(bound))])} {cumulative}")
+                lines.append(f"{metric}_bucket{format_labels([('span', name), ('le', '+Inf')])} {span['count']}")
+                lines.append(f"{metric}_sum{format_labels([('span', name)])} {span['total']}")
+                lines.append(f"{metric}_count{format_labels([('span', name)])} {span['count']}")
+        return '\n'.join(lines) + '\n'
+    
+    def export(self, path):
+        """Write the metrics to path: JSON for a .json file, Prometheus text otherwise"""
+        text = self.to_json() if path.lower().endswith('.json') else self.to_prometheus()
+        with open(path, 'w') as f:
+            f.write(text)
+
+
+# Shared by everything in the process, so one diagnostics view covers it all
+metrics = Metrics()
+
+
+class TokenBucket:
+    """Token bucket holding up to `capacity` tokens, refilled evenly over `period` seconds"""
+    
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.period = period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+    
+    def refill(self, now):
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.capacity / self.period)
+        self.updated = now
+    
+    def wait_time(self):
+        """Seconds until one token is available (0 if one is available now)"""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.period / self.capacity
+    
+    def drain(self):
+        self.tokens = 0.0
+
+
+class RateLimiter:
+    """Keeps API calls within both the per-minute and the per-day budget"""
+    
+    def __init__(self, calls_per_minute=API_CALLS_PER_MINUTE, calls_per_day=API_CALLS_PER_DAY):
+        self.buckets = []
+        if calls_per_minute:
+            self.buckets.append(TokenBucket(calls_per_minute, 60))
+        if calls_per_day:
+            self.buckets.append(TokenBucket(calls_per_day, 86400))
+        self.lock = threading.Lock()
+    
+    def acquire(self, cancel_event=None):
+        """Block until a call may be made. Returns False if cancelled while waiting."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                for bucket in self.buckets:
+                    bucket.refill(now)
+                wait = max([bucket.wait_time() for bucket in self.buckets] or [0])
+                if wait == 0:
+                    for bucket in self.buckets:
+                        bucket.tokens -= 1
+                    return True
+            
+            if cancel_event is not None:
+                if cancel_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+    
+    def throttled(self):
+        """Called when the API reports throttling; stop bursting until the minute bucket refills"""
+        with self.lock:
+            if self.buckets:
+                self.buckets[0].drain()
+
+
+class QuoteRefreshEngine:
+    """Fetches quotes for many symbols concurrently and yields them as they arrive"""
+    
+    def __init__(self, fetch, max_workers=REFRESH_WORKERS):
+        self.fetch = fetch
+        self.max_workers = max_workers
+    
+    def refresh(self, symbols, cancel_event=None):
+        """Yield (symbol, data) pairs in completion order; data is None on failure"""
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return
+        
+        workers = max(1, min(self.max_workers, len(symbols)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.fetch, symbol, cancel_event): symbol for symbol in symbols}
+            try:
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+            finally:
+                # Consumer stopped early, don't start the remaining requests
+                for future in futures:
+                    future.cancel()
+
+
+class MetadataCache:
+    """On-disk cache of company metadata keyed by symbol, with TTL and LRU eviction"""
+    
+    def __init__(self, path=METADATA_CACHE_FILE, ttl=METADATA_TTL, max_entries=METADATA_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+    
+    def load(self):
+        """Load cached entries from disk, dropping expired ones"""
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                now = time.time()
+                # Stored oldest-used first, so insertion order restores the LRU order
+                for symbol, entry in data.items():
+                    if now - entry.get('fetched_at', 0) < self.ttl:
+                        self.entries[symbol] = entry
+        except Exception as e:
+            logger.error(f"Error loading metadata cache: {str(e)}")
+            self.entries = OrderedDict()
+    
+    def get(self, symbol):
+        """Return the cached metadata dict for symbol, or None if missing or expired"""
+        with self.lock:
+            entry = self.entries.get(symbol)
+            if entry is None:
+                metrics.increment('cache_misses', cache='metadata')
+                return None
+            if time.time() - entry.get('fetched_at', 0) >= self.ttl:
+                del self.entries[symbol]
+                self.dirty = True
+                metrics.increment('cache_misses', cache='metadata')
+                return None
+            self.entries.move_to_end(symbol)
+            metrics.increment('cache_hits', cache='metadata')
+            return entry
+    
+    def put(self, symbol, **metadata):
+        with self.lock:
+            metadata['fetched_at'] = time.time()
+            self.entries[symbol] = metadata
+            self.entries.move_to_end(symbol)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+    
+    def save(self):
+        """Write the cache to disk if it changed"""
+        with self.lock:
+            if not self.dirty:
+                return
+            snapshot = dict(self.entries)
+            self.dirty = False
+        
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Error saving metadata cache: {str(e)}")
+
+
+class Lot:
+    """One purchase of a stock"""
+    
+    __slots__ = ('lot_id', 'symbol', 'shares', 'buy_price', 'bought_at')
+    
+    def __init__(self, lot_id, symbol, shares, buy_price, bought_at=None):
+        self.lot_id = lot_id
+        self.symbol = symbol
+        self.shares = shares
+        self.buy_price = buy_price
+        self.bought_at = bought_at
+
+
+class Position:
+    """All lots held of one symbol, with their aggregated cost basis"""
+    
+    __slots__ = ('symbol', 'name', 'current_price', 'lots', 'shares', 'cost')
+    
+    def __init__(self, symbol, name, current_price=None):
+        self.symbol = symbol
+        self.name = name
+        self.current_price = current_price
+        self.lots = {}
+        self.shares = 0.0
+        self.cost = 0.0
+    
+    @property
+    def buy_price(self):
+        """Average purchase price per share"""
+        return self.cost / self.shares if self.shares else 0.0
+    
+    @property
+    def price(self):
+        """Current price, or the average purchase price before the first quote"""
+        return self.current_price if self.current_price is not None else self.buy_price
+    
+    @property
+    def value(self):
+        if self.current_price is None:
+            return self.cost
+        return self.shares * self.current_price
+
+
+class PortfolioLedger:
+    """Positions indexed by symbol and lots indexed by id, with running portfolio totals
+    
+    Every change is recorded in changed_positions / changed_lots so storage
+    can write only the records that changed.
+    """
+    
+    def __init__(self):
+        self.positions = {}
+        self.lots = {}
+        self.next_lot_id = 1
+        self.total_cost = 0.0
+        self.total_value = 0.0
+        
+        # Insertion-ordered sets (dict keys), so new positions are stored in the order they were opened
+        self.changed_positions = {}
+        self.changed_lots = {}
+    
+    def __len__(self):
+        return len(self.positions)
+    
+    def __iter__(self):
+        return iter(self.positions.values())
+    
+    def __contains__(self, symbol):
+        return symbol in self.positions
+    
+    def get(self, symbol):
+        return self.positions.get(symbol)
+    
+    def _detach(self, position):
+        self.total_cost -= position.cost
+        self.total_value -= position.value
+    
+    def _attach(self, position):
+        self.total_cost += position.cost
+        self.total_value += position.value
+    
+    def add_lot(self, symbol, shares, buy_price, name=None, current_price=None, lot_id=None, bought_at=None):
+        """Add a purchase lot, opening the position if needed. Returns the Lot."""
+        position = self.positions.get(symbol)
+        if position is None:
+            position = Position(symbol, name or symbol)
+            self.positions[symbol] = position
+        else:
+            self._detach(position)
+        
+        if lot_id is None:
+            lot_id = self.next_lot_id
+        self.next_lot_id = max(self.next_lot_id, lot_id + 1)
+        
+        lot = Lot(lot_id, symbol, shares, buy_price, bought_at)
+        position.lots[lot_id] = lot
+        self.lots[lot_id] = lot
+        position.shares += shares
+        position.cost += shares * buy_price
+        if name:
+            position.name = name
+        if current_price is not None:
+            position.current_price = current_price
+        
+        self._attach(position)
+        self.changed_positions[symbol] = None
+        self.changed_lots[lot_id] = None
+        return lot
+    
+    def remove_lot(self, lot_id):
+        """Remove one lot; the position is closed with its last lot"""
+        lot = self.lots.pop(lot_id)
+        position = self.positions[lot.symbol]
+        self._detach(position)
+        
+        del position.lots[lot_id]
+        self.changed_lots[lot_id] = None
+        if not position.lots:
+            del self.positions[lot.symbol]
+            self.changed_positions[lot.symbol] = None
+            return
+        
+        position.shares -= lot.shares
+        position.cost -= lot.shares * lot.buy_price
+        self._attach(position)
+    
+    def remove_position(self, symbol):
+        """Remove a symbol and all its lots"""
+        position = self.positions.get(symbol)
+        if position is not None:
+            for lot_id in list(position.lots):
+                self.remove_lot(lot_id)
+    
+    def update_price(self, symbol, price, name=None):
+        position = self.positions[symbol]
+        self._detach(position)
+        position.current_price = price
+        if name:
+            position.name = name
+        self._attach(position)
+        self.changed_positions[symbol] = None
+    
+    def take_changes(self):
+        """Return and reset the (symbols, lot ids) changed since the last call"""
+        changes = (self.changed_positions, self.changed_lots)
+        self.changed_positions = {}
+        self.changed_lots = {}
+        return changes
+
+
+def ledger_from_records(records):
+    """Build a ledger from old-style {'symbol', 'name', 'shares', 'buy_price', 'current_price'} records"""
+    ledger = PortfolioLedger()
+    for stock in records:
+        ledger.add_lot(
+            stock['symbol'], stock['shares'], stock['buy_price'],
+            name=stock.get('name'), current_price=stock.get('current_price')
+        )
+    return ledger
+
+
+def read_ledger(conn):
+    """Build the ledger from a schema version 2 database, streaming rows"""
+    ledger = PortfolioLedger()
+    names = {}
+    prices = {}
+    for symbol, name, current_price in conn.execute(
+        "SELECT symbol, name, current_price FROM positions ORDER BY rowid"
+    ):
+        names[symbol] = name
+        prices[symbol] = current_price
+        # Reserve the position's place so display order follows insertion order
+        ledger.positions[symbol] = None
+    
+    for lot_id, symbol, shares, buy_price, bought_at in conn.execute(
+        "SELECT lot_id, symbol, shares, buy_price, bought_at FROM lots ORDER BY lot_id"
+    ):
+        ledger.add_lot(
+            symbol, shares, buy_price, name=names.get(symbol), current_price=prices.get(symbol),
+            lot_id=lot_id, bought_at=bought_at
+        )
+    
+    # Positions without lots are left-overs; don't show them
+    for symbol in [symbol for symbol, position in ledger.positions.items() if position is None]:
+        del ledger.positions[symbol]
+    ledger.take_changes()
+    return ledger
+
+
+class PortfolioStore:
+    """SQLite (WAL mode) storage of the portfolio ledger that writes only changed records"""
+    
+    # PRAGMA user_version: 1 = one row per symbol (holdings), 2 = positions and lots
+    SCHEMA_VERSION = 2
+    
+    def __init__(self, path=PORTFOLIO_DB, legacy_path=LEGACY_PORTFOLIO_FILE):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS positions (symbol TEXT PRIMARY KEY, name TEXT, current_price REAL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS lots ("
+                "lot_id INTEGER PRIMARY KEY, symbol TEXT NOT NULL, shares REAL, buy_price REAL, bought_at TEXT)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS lots_symbol ON lots (symbol)")
+        
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version == 0:
+            self.import_legacy(legacy_path)
+        elif version == 1:
+            self.migrate_holdings()
+    
+    def import_records(self, records):
+        """Store old-style holding records as one lot each"""
+        self.sync(ledger_from_records(records))
+    
+    def import_legacy(self, legacy_path):
+        """Import a portfolio.json written by older versions (the file is left in place)"""
+        try:
+            if legacy_path and os.path.exists(legacy_path):
+                with open(legacy_path, 'r') as f:
+                    self.import_records(json.load(f))
+        except Exception as e:
+            logger.error(f"Error importing {legacy_path}: {str(e)}")
+            return
+        
+        with self.conn:
+            self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+    
+    def migrate_holdings(self):
+        """Convert the one-row-per-symbol holdings table into positions and lots"""
+        fields = ('symbol', 'name', 'shares', 'buy_price', 'current_price')
+        rows = self.conn.execute(f"SELECT {', '.join(fields)} FROM holdings ORDER BY rowid").fetchall()
+        self.import_records(dict(zip(fields, row)) for row in rows)
+        with self.conn:
+            self.conn.execute("DROP TABLE holdings")
+            self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+    
+    def load(self):
+        """Build the ledger, streaming rows from the database"""
+        return read_ledger(self.conn)
+    
+    def sync(self, ledger):
+        """Write the positions and lots changed since the last sync in one transaction"""
+        symbols, lot_ids = ledger.take_changes()
+        if not symbols and not lot_ids:
+            return
+        
+        upserts, deletes = [], []
+        for symbol in symbols:
+            position = ledger.positions.get(symbol)
+            if position is None:
+                deletes.append((symbol,))
+            else:
+                upserts.append((symbol, position.name, position.current_price))
+        
+        lot_upserts, lot_deletes = [], []
+        for lot_id in lot_ids:
+            lot = ledger.lots.get(lot_id)
+            if lot is None:
+                lot_deletes.append((lot_id,))
+            else:
+                lot_upserts.append((lot_id, lot.symbol, lot.shares, lot.buy_price, lot.bought_at))
+        
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO positions (symbol, name, current_price) VALUES (?, ?, ?) "
+                    "ON CONFLICT(symbol) DO UPDATE SET name = excluded.name, current_price = excluded.current_price",
+                    upserts
+                )
+                self.conn.executemany("DELETE FROM positions WHERE symbol = ?", deletes)
+                self.conn.executemany("INSERT OR REPLACE INTO lots VALUES (?, ?, ?, ?, ?)", lot_upserts)
+                self.conn.executemany("DELETE FROM lots WHERE lot_id = ?", lot_deletes)
+        except Exception:
+            # Keep the changes so the next save retries them
+            ledger.changed_positions.update(symbols)
+            ledger.changed_lots.update(lot_ids)
+            raise
+
+
+def last_trading_day(today=None):
+    """The most recent weekday before today (exchange holidays are not known)"""
+    day = (today or datetime.now().date()) - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+
+def trading_days_since(date_str, today=None):
+    """Approximate number of trading days (weekdays) after date_str up to today"""
+    start = datetime.strptime(date_str, "%Y-%m-%d").date()
+    end = today or datetime.now().date()
+    days = (end - start).days
+    weeks, rest = divmod(days, 7)
+    extra = sum(1 for i in range(1, rest + 1) if (start + timedelta(days=i)).weekday() < 5)
+    return weeks * 5 + extra
+
+
+def throttle_message(data):
+    """The rate-limit message of a decoded response, or None if it isn't throttled
+    
+    The per-minute limit is reported as a Note and the daily one as
+    Information, which is also used for other notices (e.g. premium-only
+    endpoints), so only its rate-limit wording counts.
+    """
+    if data.get('Note'):
+        return data['Note']
+    message = data.get('Information')
+    if message and any(wording in str(message).lower() for wording in THROTTLE_WORDING):
+        return message
+    return None
+
+
+def endpoint_unavailable(data):
+    """True if a decoded response says the endpoint is premium-only or doesn't exist"""
+    if throttle_message(data) is not None:
+        # The daily limit message mentions premium plans too
+        return False
+    message = str(data.get('Information') or data.get('Error Message') or '').lower()
+    return 'premium endpoint' in message or 'does not exist' in message
+
+
+def parse_daily_series(chunks, since=None):
+    """Parse a TIME_SERIES_DAILY JSON body, given as byte chunks, into a bar array
+    
+    Bars are matched as the chunks arrive and converted a chunk at a time with
+    NumPy, so the payload is never decoded into one dict per day.
+    
+    Args:
+        chunks (iterable): The response body as bytes chunks
+        since (str): Only keep bars after this date (YYYY-MM-DD)
+    
+    Returns:
+        tuple: (DAILY_BAR_DTYPE array sorted by date, None) if the body holds a
+            series, or (empty array, decoded JSON) if it doesn't, e.g. a Note
+    """
+    parts = []
+    found = False
+    head = b''
+    buffer = b''
+    for chunk in chunks:
+        if len(head) < PARSE_HEAD_BYTES:
+            head += chunk[:PARSE_HEAD_BYTES - len(head)]
+        buffer += chunk
+        
+        # Each '}' closes a bar (or an outer object), so everything up to the
+        # last one holds complete bars; the rest waits for the next chunk
+        end = buffer.rfind(b'}') + 1
+        fields = DAILY_BAR_PATTERN.findall(buffer, 0, end)
+        buffer = buffer[end:]
+        if not fields:
+            continue
+        found = True
+        
+        text = np.array(fields, dtype='S32')
+        part = np.empty(len(text), dtype=DAILY_BAR_DTYPE)
+        part['date'] = text[:, 0].astype('U10').astype('datetime64[D]')
+        for column, name in enumerate(('open', 'high', 'low', 'close'), 1):
+            part[name] = text[:, column].astype(float)
+        part['volume'] = text[:, 5].astype(np.int64)
+        if since is not None:
+            part = part[part['date'] > np.datetime64(since)]
+        parts.append(part)
+    
+    if not found:
+        try:
+            return np.empty(0, dtype=DAILY_BAR_DTYPE), json.loads(head)
+        except ValueError:
+            return np.empty(0, dtype=DAILY_BAR_DTYPE), {}
+    
+    # The API sends the newest day first
+    bars = np.concatenate(parts)
+    return bars[np.argsort(bars['date'], kind='stable')], None
+
+
+class PriceHistoryStore:
+    """SQLite store of daily OHLCV bars, appended to incrementally per symbol"""
+    
+    def __init__(self, path=PRICE_HISTORY_DB, sync_interval=HISTORY_SYNC_INTERVAL):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS daily_bars ("
+                "symbol TEXT NOT NULL, date TEXT NOT NULL, "
+                "open REAL, high REAL, low REAL, close REAL, volume INTEGER, "
+                "PRIMARY KEY (symbol, date)) WITHOUT ROWID"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS history_sync (symbol TEXT PRIMARY KEY, synced_at REAL NOT NULL, "
+                "complete INTEGER NOT NULL DEFAULT 0)"
+            )
+            # Stores created before history depth was tracked
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(history_sync)")]
+            if 'complete' not in columns:
+                self.conn.execute("ALTER TABLE history_sync ADD COLUMN complete INTEGER NOT NULL DEFAULT 0")
+    
+    def last_date(self, symbol):
+        """Date (YYYY-MM-DD) of the newest stored bar, or None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT MAX(date) FROM daily_bars WHERE symbol = ?", (symbol,)
+            ).fetchone()
+        return row[0]
+    
+    def depth(self, symbol):
+        """(number of stored bars, earliest stored date or None, True if that is all the history there is)"""
+        with self.lock:
+            count, first_date = self.conn.execute(
+                "SELECT COUNT(*), MIN(date) FROM daily_bars WHERE symbol = ?", (symbol,)
+            ).fetchone()
+            row = self.conn.execute(
+                "SELECT complete FROM history_sync WHERE symbol = ?", (symbol,)
+            ).fetchone()
+        return count, first_date, bool(row and row[0])
+    
+    def needs_older(self, symbol, days):
+        """True if fewer than `days` bars are stored and older ones may exist"""
+        count, first_date, complete = self.depth(symbol)
+        return count < days and not complete
+    
+    def needs_sync(self, symbol, days=0):
+        """True if the newest completed trading day, or bars within the last `days`, may be missing from the store"""
+        if days and self.needs_older(symbol, days):
+            return True
+        
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT synced_at FROM history_sync WHERE symbol = ?", (symbol,)
+            ).fetchone()
+        if row is not None and time.time() - row[0] < self.sync_interval:
+            return False
+        
+        last_date = self.last_date(symbol)
+        return last_date is None or last_date < last_trading_day().isoformat()
+    
+    def append(self, symbol, bars, complete=False):
+        """Store a DAILY_BAR_DTYPE array of bars and mark the symbol synced
+        
+        complete marks the bars as reaching back to the start of the
+        symbol's history, so older bars are never requested again.
+        """
+        rows = zip(
+            [symbol] * len(bars),
+            bars['date'].astype(str).tolist(),
+            bars['open'].tolist(),
+            bars['high'].tolist(),
+            bars['low'].tolist(),
+            bars['close'].tolist(),
+            bars['volume'].tolist()
+        )
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO daily_bars VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.execute(
+                "INSERT INTO history_sync (symbol, synced_at, complete) VALUES (?, ?, ?) "
+                "ON CONFLICT(symbol) DO UPDATE SET synced_at = excluded.synced_at, "
+                "complete = MAX(complete, excluded.complete)",
+                (symbol, time.time(), int(complete))
+            )
+    
+    def window(self, symbol, days):
+        """The last `days` bars of symbol as a DAILY_BAR_DTYPE array, oldest first"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT date, open, high, low, close, volume FROM daily_bars "
+                "WHERE symbol = ? ORDER BY date DESC LIMIT ?", (symbol, days)
+            ).fetchall()
+        
+        return np.array(rows[::-1], dtype=DAILY_BAR_DTYPE)
+    
+    def daily_volatility(self, symbols, days=VOLATILITY_DAYS):
+        """Standard deviation of daily returns over the last `days` stored bars, per symbol"""
+        volatility = {}
+        for symbol in symbols:
+            closes = self.window(symbol, days + 1)['close']
+            previous, current = closes[:-1], closes[1:]
+            returns = current[previous != 0] / previous[previous != 0] - 1
+            if len(returns) > 1:
+                volatility[symbol] = float(np.std(returns, ddof=1))
+        return volatility
+
+
+class MarketHours:
+    """Regular trading session of an exchange; weekends are closed, holidays are not known"""
+    
+    def __init__(self, tz_name=MARKET_TIMEZONE, open_time=MARKET_OPEN, close_time=MARKET_CLOSE):
+        try:
+            self.tz = ZoneInfo(tz_name)
+        except Exception:
+            # No tz database available; fall back to US Eastern standard time
+            self.tz = timezone(timedelta(hours=-5))
+        self.open_time = open_time
+        self.close_time = close_time
+    
+    def session(self, day):
+        """(open, close) timestamps of the session on a date"""
+        start = datetime(day.year, day.month, day.day, *self.open_time, tzinfo=self.tz)
+        end = datetime(day.year, day.month, day.day, *self.close_time, tzinfo=self.tz)
+        return start.timestamp(), end.timestamp()
+    
+    def is_open(self, now):
+        today = datetime.fromtimestamp(now, self.tz).date()
+        if today.weekday() >= 5:
+            return False
+        start, end = self.session(today)
+        return start <= now < end
+    
+    def last_close(self, now):
+        """Timestamp of the most recent session close at or before now"""
+        day = datetime.fromtimestamp(now, self.tz).date()
+        for _ in range(8):
+            if day.weekday() < 5:
+                start, end = self.session(day)
+                if end <= now:
+                    return end
+            day -= timedelta(days=1)
+        return 0.0
+    
+    def next_open(self, now):
+        """Timestamp of the next session open after now"""
+        day = datetime.fromtimestamp(now, self.tz).date()
+        for _ in range(8):
+            if day.weekday() < 5:
+                start, end = self.session(day)
+                if start > now:
+                    return start
+            day += timedelta(days=1)
+        return now + 86400
+
+
+class RefreshScheduler:
+    """Background quote refresh driven by quote age, market hours and position priority
+    
+    Each symbol is due when its quote stops being fresh: after its maximum age
+    while the market is open (shorter for large and volatile positions), or at
+    the next open once a quote taken after the last close is held. The most
+    overdue symbol is fetched first, one call per interval so the calls are
+    spread evenly over the share of the API budget given to the scheduler.
+    """
+    
+    def __init__(self, fetch, on_quote, calls_per_minute=API_CALLS_PER_MINUTE, calls_per_day=API_CALLS_PER_DAY,
+                 budget_share=SCHEDULER_BUDGET_SHARE, max_age=QUOTE_MAX_AGE, market=None, price_history=None,
+                 priority_interval=PRIORITY_INTERVAL):
+        self.fetch = fetch
+        self.on_quote = on_quote
+        self.max_age = max_age
+        self.market = market if market is not None else MarketHours()
+        self.price_history = price_history
+        
+        # Seconds between scheduled calls
+        intervals = [60.0 / calls_per_minute if calls_per_minute else 0.0]
+        if calls_per_day:
+            intervals.append(86400.0 / calls_per_day)
+        self.interval = max(intervals) / budget_share
+        
+        self.lock = threading.Lock()
+        self.quoted_at = {}
+        self.retry_at = {}
+        self.values = {}
+        self.priorities = {}
+        self.priorities_dirty = False
+        self.priority_interval = priority_interval
+        self.priorities_at = 0.0
+        self.next_call_at = 0.0
+        
+        self.stop_event = threading.Event()
+        self.wakeup = threading.Event()
+        self.thread = None
+    
+    def set_holdings(self, values):
+        """Set the symbols to keep fresh and their position values {symbol: value}
+        
+        Cheap enough to call on every price tick: only a change of the symbols
+        recomputes priorities right away, new values are picked up by the
+        next periodic update.
+        """
+        with self.lock:
+            if values.keys() == self.values.keys():
+                self.values = dict(values)
+                return
+            self.values = dict(values)
+            self.priorities_dirty = True
+        self.wakeup.set()
+    
+    def mark_quoted(self, symbol, when=None):
+        """Record a quote obtained elsewhere (e.g. a manual refresh)"""
+        with self.lock:
+            self.quoted_at[symbol] = when if when is not None else time.time()
+    
+    def update_priorities(self):
+        """Priority = value weight x (1 + volatility), normalized to a mean of 1"""
+        with self.lock:
+            values = dict(self.values)
+            self.priorities_dirty = False
+            self.priorities_at = time.monotonic()
+        
+        volatility = {}
+        if self.price_history is not None:
+            try:
+                volatility = self.price_history.daily_volatility(values)
+            except Exception as e:
+                logger.error(f"Error reading volatility: {str(e)}")
+        
+        # Daily volatility is a few percent; scale it so it matters next to the weight
+        raw = {symbol: max(value, 0.0) * (1 + 10 * volatility.get(symbol, 0.0)) for symbol, value in values.items()}
+        mean = sum(raw.values()) / len(raw) if raw else 0.0
+        with self.lock:
+            self.priorities = {symbol: (p / mean if mean > 0 else 1.0) for symbol, p in raw.items()}
+    
+    def max_age_for(self, symbol):
+        priority = self.priorities.get(symbol, 1.0)
+        return self.max_age / min(max(priority, 0.25), 4.0)
+    
+    def due_time(self, symbol, now):
+        """When the quote of symbol stops being fresh"""
+        quoted_at = self.quoted_at.get(symbol, 0.0)
+        if not self.market.is_open(now):
+            # The closing price doesn't change until the next session
+            if quoted_at >= self.market.last_close(now):
+                return self.market.next_open(now)
+            due = quoted_at
+        else:
+            due = quoted_at + self.max_age_for(symbol)
+        return max(due, self.retry_at.get(symbol, 0.0))
+    
+    def next_due(self, now):
+        """(symbol, due time) of the symbol that goes stale first, or (None, None)"""
+        best = (None, None)
+        with self.lock:
+            for symbol in self.values:
+                due = self.due_time(symbol, now)
+                if best[1] is None or due < best[1] or (
+                    due == best[1] and self.priorities.get(symbol, 1.0) > self.priorities.get(best[0], 1.0)
+                ):
+                    best = (symbol, due)
+        return best
+    
+    def run(self):
+        while not self.stop_event.is_set():
+            if self.priorities_dirty or time.monotonic() - self.priorities_at >= self.priority_interval:
+                self.update_priorities()
+            
+            now = time.time()
+            symbol, due = self.next_due(now)
+            if symbol is None:
+                wait = None
+            else:
+                wait = max(due, self.next_call_at) - now
+            
+            if wait is None or wait > 0:
+                # Sleep until something is due; holdings changes and stop() wake us early
+                self.wakeup.wait(wait)
+                self.wakeup.clear()
+                continue
+            
+            self.next_call_at = now + self.interval
+            data = self.fetch(symbol, self.stop_event)
+            if self.stop_event.is_set():
+                break
+            
+            # A failed fetch is retried after a quarter of the max age, not immediately
+            with self.lock:
+                if data:
+                    self.quoted_at[symbol] = time.time()
+                    self.retry_at.pop(symbol, None)
+                else:
+                    self.retry_at[symbol] = time.time() + self.max_age_for(symbol) / 4
+            self.on_quote(symbol, data)
+    
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def stop(self, timeout=5):
+        """Stop the scheduler thread, interrupting any wait"""
+        self.stop_event.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+
+class HttpProvider:
+    """Data provider speaking the Alpha Vantage query API over HTTP
+    
+    A provider has one method, get(params, stream), returning a response with
+    json(), iter_content(chunk_size) and context manager support, like a
+    requests.Response. portfolio_replay has offline stand-ins; pointing this
+    provider at a ReplayServer url exercises the real HTTP path locally.
+    """
+    
+    def __init__(self, url=ALPHA_VANTAGE_URL):
+        self.url = url
+        self.http_local = threading.local()
+    
+    def get(self, params, stream=False):
+        # One keep-alive session per worker thread
+        session = getattr(self.http_local, 'session', None)
+        if session is None:
+            # requests is imported on the first request rather than at startup
+            import requests
+            session = requests.Session()
+            self.http_local.session = session
+        return session.get(self.url, params=params, stream=stream)
+
+
+class AlphaVantageClient:
+    """Rate-limited, cached access to the Alpha Vantage API"""
+    
+    API_URL = ALPHA_VANTAGE_URL
+    
+    def __init__(self, api_key, calls_per_minute=API_CALLS_PER_MINUTE, calls_per_day=API_CALLS_PER_DAY,
+                 workers=REFRESH_WORKERS, metadata_cache=None, price_history=None, batch_size=BATCH_QUOTE_SIZE,
+                 provider=None):
+        self.api_key = api_key
+        self.batch_size = batch_size
+        self.batch_supported = False
+        
+        # Where requests go: Alpha Vantage itself unless a stand-in is given
+        self.provider = provider if provider is not None else HttpProvider(self.API_URL)
+        
+        # Shared API budget and concurrent quote fetching
+        self.rate_limiter = RateLimiter(calls_per_minute, calls_per_day)
+        self.refresh_engine = QuoteRefreshEngine(
+            lambda symbol, cancel_event: self.fetch_stock_data(symbol, False, cancel_event),
+            workers
+        )
+        self.history_engine = QuoteRefreshEngine(
+            lambda symbol, cancel_event: self.fetch_historical_data(symbol, ANALYTICS_DAYS, cancel_event),
+            workers
+        )
+        self.batch_engine = QuoteRefreshEngine(self.fetch_batch_quotes, workers)
+        
+        # Company names rarely change, so keep them across sessions
+        self.metadata_cache = metadata_cache if metadata_cache is not None else MetadataCache()
+        
+        # Daily bars already downloaded are served from disk
+        self.price_history = price_history if price_history is not None else PriceHistoryStore()
+    
+    def send_request(self, function, symbol, cancel_event=None, stream=False, **params):
+        """Make a rate-limited Alpha Vantage request and return the response
+        
+        Returns None if cancel_event is set while waiting for the rate limiter.
+        With stream=True the body is left unread for the caller to iterate.
+        """
+        with metrics.span('rate_limit_wait'):
+            if not self.rate_limiter.acquire(cancel_event):
+                return None
+        
+        params.update(function=function, symbol=symbol, apikey=self.api_key)
+        metrics.increment('api_calls', function=function)
+        with metrics.span('http_request'):
+            return self.provider.get(params, stream=stream)
+    
+    def rate_limited(self, function, data):
+        """Check a decoded response for a rate-limit message, and back off if there is one"""
+        if throttle_message(data) is None:
+            return False
+        metrics.increment('rate_limit_notes', function=function)
+        self.rate_limiter.throttled()
+        return True
+    
+    def api_get(self, function, symbol, cancel_event=None, **params):
+        """Make a rate-limited Alpha Vantage request and return the decoded JSON
+        
+        Returns an empty dict if cancel_event is set while waiting for the rate limiter.
+        """
+        response = self.send_request(function, symbol, cancel_event, **params)
+        if response is None:
+            return {}
+        with metrics.span('json_parse'):
+            data = response.json()
+        self.rate_limited(function, data)
+        return data
+    
+    @metrics.timed('fetch_stock_data')
+    def fetch_stock_data(self, symbol, fetch_name=True, cancel_event=None):
+        """Fetch current stock data from Alpha Vantage API
+        
+        The company name comes from the metadata cache. On a cache miss the
+        OVERVIEW endpoint is only called when fetch_name is True; otherwise
+        'name' is None.
+        """
+        try:
+            # Endpoint for current price (Global Quote)
+            data = self.api_get("GLOBAL_QUOTE", symbol, cancel_event)
+            
+            # Extract relevant data
+            if 'Global Quote' in data and data['Global Quote']:
+                quote = data['Global Quote']
+                price = float(quote.get('05. price', 0))
+                
+                # Get company name from the cache, or the OVERVIEW endpoint on a miss
+                metadata = self.metadata_cache.get(symbol)
+                if metadata is not None:
+                    name = metadata['name']
+                elif fetch_name:
+                    overview_data = self.api_get("OVERVIEW", symbol, cancel_event)
+                    name = overview_data.get('Name', symbol)
+                    if 'Name' in overview_data:
+                        self.metadata_cache.put(symbol, name=name)
+                else:
+                    name = None
+                
+                return {
+                    'symbol': symbol,
+                    'name': name,
+                    'price': price
+                }
+            else:
+                message = throttle_message(data)
+                if message is not None:
+                    logger.warning(f"API limit reached: {message}")
+                return None
+        except Exception as e:
+            logger.error(f"Error fetching stock data for {symbol}: {str(e)}")
+            metrics.increment('errors', operation='fetch_stock_data')
+            return None
+    
+    @metrics.timed('fetch_batch_quotes')
+    def fetch_batch_quotes(self, symbols, cancel_event=None):
+        """Fetch quotes for up to batch_size symbols in one REALTIME_BULK_QUOTES request
+        
+        Returns a dict of stock data (as from fetch_stock_data with fetch_name
+        False) for the symbols present in the response; symbols the response
+        leaves out are missing from the dict. A throttled request is sent
+        again, up to BATCH_RETRIES times, once the rate limiter has backed
+        off. Returns None if no response with quotes came back.
+        """
+        try:
+            for attempt in range(BATCH_RETRIES + 1):
+                data = self.api_get("REALTIME_BULK_QUOTES", ",".join(symbols), cancel_event)
+                message = throttle_message(data)
+                if message is None:
+                    break
+                logger.warning(f"API limit reached: {message}")
+            
+            if not isinstance(data.get('data'), list):
+                if endpoint_unavailable(data) and self.batch_size:
+                    # Not available with this API key; stop spending calls on it
+                    message = data.get('Information') or data.get('Error Message')
+                    logger.warning(f"Batch quotes unavailable, using per-symbol quotes: {message}")
+                    self.batch_size = 0
+                return None
+            
+            self.batch_supported = True
+            
+            requested = set(symbols)
+            quotes = {}
+            for quote in data['data']:
+                symbol = quote.get('symbol')
+                if symbol not in requested or not quote.get('close'):
+                    continue
+                metadata = self.metadata_cache.get(symbol)
+                quotes[symbol] = {
+                    'symbol': symbol,
+                    'name': metadata['name'] if metadata is not None else None,
+                    'price': float(quote['close'])
+                }
+            return quotes
+        except Exception as e:
+            logger.error(f"Error fetching batch quotes: {str(e)}")
+            metrics.increment('errors', operation='fetch_batch_quotes')
+            return None
+    
+    def refresh_quotes(self, symbols, cancel_event=None):
+        """Yield (symbol, data) for many symbols, batch_size symbols per request
+        
+        Batches are fetched concurrently; symbols a batch response doesn't
+        include are then fetched one by one with GLOBAL_QUOTE. A batch that
+        got no response (e.g. still throttled) yields None for its symbols
+        rather than spending a call on each. With batching disabled this is
+        the same as refresh_engine.refresh.
+        """
+        symbols = list(dict.fromkeys(symbols))
+        missing = symbols
+        
+        if self.batch_size and len(symbols) > 1:
+            chunks = [tuple(symbols[i:i + self.batch_size]) for i in range(0, len(symbols), self.batch_size)]
+            missing = []
+            for chunk, quotes in self._batch_results(chunks, cancel_event):
+                if quotes is None:
+                    if self.batch_size:
+                        for symbol in chunk:
+                            yield symbol, None
+                    else:
+                        # Batching turned out to be unavailable
+                        missing.extend(chunk)
+                    continue
+                for symbol in chunk:
+                    if symbol in quotes:
+                        yield symbol, quotes[symbol]
+                    else:
+                        missing.append(symbol)
+            
+            if cancel_event is not None and cancel_event.is_set():
+                return
+        
+        yield from self.refresh_engine.refresh(missing, cancel_event)
+    
+    def _batch_results(self, chunks, cancel_event=None):
+        """Yield (chunk, quotes) for each chunk of symbols
+        
+        Until a bulk request has succeeded, chunks are sent one at a time:
+        if the API key can't use the endpoint, only one call is spent
+        finding out. The rest then go to batch_engine concurrently.
+        """
+        chunks = list(chunks)
+        while chunks and not self.batch_supported:
+            chunk = chunks.pop(0)
+            yield chunk, self.fetch_batch_quotes(chunk, cancel_event) if self.batch_size else None
+        yield from self.batch_engine.refresh(chunks, cancel_event)
+    
+    @metrics.timed('fetch_historical_data')
+    def fetch_historical_data(self, symbol, days=30, cancel_event=None):
+        """Return the last `days` daily bars of symbol as a DAILY_BAR_DTYPE array
+        
+        Bars are served from the local price history store; only the missing
+        trailing days are downloaded from Alpha Vantage. If fewer than `days`
+        bars are stored (e.g. an earlier compact sync), the series is fetched
+        again far enough back.
+        """
+        try:
+            if not self.price_history.needs_sync(symbol, days):
+                metrics.increment('cache_hits', cache='price_history')
+            else:
+                metrics.increment('cache_misses', cache='price_history')
+                last_date = self.price_history.last_date(symbol)
+                if self.price_history.needs_older(symbol, days):
+                    # Older bars are missing too, so take the whole series again
+                    last_date = None
+                
+                # compact holds the last 100 bars, enough unless the gap is larger
+                if last_date is None:
+                    outputsize = "full" if days > COMPACT_BARS else "compact"
+                elif trading_days_since(last_date) >= COMPACT_BARS:
+                    outputsize = "full"
+                else:
+                    outputsize = "compact"
+                
+                # Endpoint for historical data (TIME_SERIES_DAILY), parsed as it streams in
+                response = self.send_request(
+                    "TIME_SERIES_DAILY", symbol, cancel_event, stream=True, outputsize=outputsize
+                )
+                if response is not None:
+                    with response, metrics.span('history_parse'):
+                        # Keep only the days we don't have yet
+                        new_bars, data = parse_daily_series(
+                            response.iter_content(PARSE_CHUNK_BYTES), since=last_date
+                        )
+                    
+                    if data is None:
+                        # A full series, or a whole series shorter than compact, is all there is
+                        complete = last_date is None and (outputsize == "full" or len(new_bars) < COMPACT_BARS)
+                        self.price_history.append(symbol, new_bars, complete)
+                    elif self.rate_limited("TIME_SERIES_DAILY", data):
+                        logger.warning(f"API limit reached: {throttle_message(data)}")
+            
+            return self.price_history.window(symbol, days)
+        except Exception as e:
+            logger.error(f"Error fetching historical data for {symbol}: {str(e)}")
+            metrics.increment('errors', operation='fetch_historical_data')
+            return np.empty(0, dtype=DAILY_BAR_DTYPE)
+
+
+def load_portfolio_file(path):
+    """Load a ledger from a portfolio.db database or a legacy portfolio.json file"""
+    if path.lower().endswith('.json'):
+        with open(path, 'r') as f:
+            return ledger_from_records(json.load(f))
+    
+    # Opened read-only: a wrong path must not create an empty database, and
+    # older schemas are read as they are instead of being migrated
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"No such portfolio file: {path}")
+    conn = sqlite3.connect(f"{Path(path).absolute().as_uri()}?mode=ro", uri=True)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'positions' in tables and 'lots' in tables:
+            return read_ledger(conn)
+        if 'holdings' in tables:
+            fields = ('symbol', 'name', 'shares', 'buy_price', 'current_price')
+            rows = conn.execute(f"SELECT {', '.join(fields)} FROM holdings ORDER BY rowid")
+            return ledger_from_records(dict(zip(fields, row)) for row in rows)
+        raise ValueError(f"{path} is not a portfolio database")
+    finally:
+        conn.close()
+
+
+def value_positions(ledger, quotes=None):
+    """Yield a valuation dict per position, using quotes {symbol: price} where available"""
+    quotes = quotes or {}
+    for position in ledger:
+        price = quotes.get(position.symbol)
+        if price is None:
+            price = position.price
+        price = float(price)
+        value = position.shares * price
+        gain_loss = value - position.cost
+        yield {
+            'symbol': position.symbol,
+            'name': position.name,
+            'shares': position.shares,
+            'buy_price': position.buy_price,
+            'price': price,
+            'value': value,
+            'cost': position.cost,
+            'gain_loss': gain_loss,
+            'gain_loss_pct': (gain_loss / position.cost) * 100 if position.cost > 0 else 0.0,
+        }
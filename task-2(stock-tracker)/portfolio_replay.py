@@ -0,0 +1,280 @@
+"""
+Portfolio Replay
+
+Offline stand-ins for the Alpha Vantage API, so performance can be measured
+repeatably. Responses come from recorded fixture files, or from deterministic
+synthetic data for symbols without one. They are served in-process
+(ReplayProvider) or over a local HTTP server (ReplayServer), with
+configurable latency and rate-limit throttling.
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from portfolio_core import COMPACT_BARS
+
+# Response Alpha Vantage sends instead of data when calls come too fast
+THROTTLE_NOTE = (
+    "Thank you for using Alpha Vantage! Our standard API call frequency is "
+    "5 calls per minute and 500 calls per day."
+)
+
+# Trading days in a synthetic outputsize=full series (about 20 years)
+SYNTHETIC_FULL_BARS = 5000
+
+
+class ReplayResponse:
+    """A canned response body with the parts of requests.Response the client uses"""
+    
+    status_code = 200
+    
+    def __init__(self, content):
+        self.content = content
+    
+    def json(self):
+        return json.loads(self.content)
+    
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+    
+    def close(self):
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FixtureSet:
+    """API responses keyed by function and symbol
+    
+    Recorded responses are read from <directory>/<FUNCTION>/<SYMBOL>.json (as
+    written by RecordingProvider). Symbols without a recording get synthetic
+    data derived from the symbol, so every run sees the same prices.
+    REALTIME_BULK_QUOTES responses are assembled from the per-symbol quotes.
+    """
+    
+    def __init__(self, directory=None, synthetic=True):
+        self.directory = directory
+        self.synthetic = synthetic
+    
+    def path(self, function, symbol):
+        return os.path.join(self.directory, function, f"{symbol}.json")
+    
+    def load(self, function, symbol):
+        """Recorded response body, or None"""
+        if self.directory is None:
+            return None
+        try:
+            with open(self.path(function, symbol), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+    
+    def rng(self, symbol):
+        """Random generator seeded by the symbol"""
+        return random.Random(int(hashlib.md5(symbol.encode()).hexdigest()[:8], 16))
+    
+    def price(self, symbol):
+        """Latest price of symbol: the recorded quote if there is one, else a synthetic one"""
+        body = self.load("GLOBAL_QUOTE", symbol)
+        if body is not None:
+            quote = json.loads(body).get('Global Quote') or {}
+            if quote.get('05. price'):
+                return float(quote['05. price'])
+        if not self.synthetic:
+            return None
+        return round(self.rng(symbol).uniform(5, 500), 2)
+    
+    def respond(self, params):
+        """Response body (bytes) for the query parameters of one request"""
+        function = params.get('function')
+        symbol = params.get('symbol', '')
+        
+        if function == "REALTIME_BULK_QUOTES":
+            data = []
+            for name in symbol.split(','):
+                price = self.price(name)
+                if price is not None:
+                    data.append({'symbol': name, 'close': f"{price:.4f}"})
+            return json.dumps({'endpoint': "Realtime Bulk Quotes", 'data': data}).encode()
+        
+        body = self.load(function, symbol)
+        if body is not None:
+            return body
+        if not self.synthetic:
+            return json.dumps({'Error Message': f"No fixture for {function} {symbol}"}).encode()
+        
+        if function == "GLOBAL_QUOTE":
+            price = self.price(symbol)
+            return json.dumps({'Global Quote': {'01. symbol': symbol, '05. price': f"{price:.4f}"}}).encode()
+        if function == "OVERVIEW":
+            return json.dumps({'Symbol': symbol, 'Name': f"{symbol} Inc."}).encode()
+        if function == "TIME_SERIES_DAILY":
+            days = SYNTHETIC_FULL_BARS if params.get('outputsize') == 'full' else COMPACT_BARS
+            return self.daily_series(symbol, days)
+        return json.dumps({'Error Message': f"Unsupported function {function}"}).encode()
+    
+    def daily_series(self, symbol, days):
+        """A TIME_SERIES_DAILY body: a random walk ending at today's price, newest day first"""
+        rng = self.rng(symbol)
+        close = self.price(symbol)
+        day = date.today()
+        series = {}
+        while len(series) < days:
+            if day.weekday() < 5:
+                open_price = close * (1 + rng.gauss(0, 0.005))
+                series[day.isoformat()] = {
+                    '1. open': f"{open_price:.4f}",
+                    '2. high': f"{max(open_price, close) * 1.01:.4f}",
+                    '3. low': f"{min(open_price, close) * 0.99:.4f}",
+                    '4. close': f"{close:.4f}",
+                    '5. volume': str(rng.randint(100000, 10000000)),
+                }
+                close = max(0.01, close / (1 + rng.gauss(0, 0.02)))
+            day -= timedelta(days=1)
+        
+        body = {
+            'Meta Data': {'1. Information': "Daily Prices (open, high, low, close) and Volumes", '2. Symbol': symbol},
+            'Time Series (Daily)': series,
+        }
+        return json.dumps(body, indent=4).encode()
+
+
+class ReplayProvider:
+    """In-process provider serving a FixtureSet with injected latency and throttling
+    
+    Args:
+        fixtures (FixtureSet): Responses to serve (synthetic data by default)
+        latency (float): Seconds added to every request
+        jitter (float): Up to this many extra seconds, chosen at random per request
+        calls_per_minute (int): Requests beyond this many in the last minute get
+            the API's rate-limit Note instead of data (0 = never throttle)
+    """
+    
+    def __init__(self, fixtures=None, latency=0.0, jitter=0.0, calls_per_minute=0):
+        self.fixtures = fixtures if fixtures is not None else FixtureSet()
+        self.latency = latency
+        self.jitter = jitter
+        self.calls_per_minute = calls_per_minute
+        self.calls = deque()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+    
+    def allow(self):
+        """Count one request; False if it is over the per-minute limit"""
+        now = time.monotonic()
+        with self.lock:
+            self.requests += 1
+            if not self.calls_per_minute:
+                return True
+            while self.calls and now - self.calls[0] >= 60:
+                self.calls.popleft()
+            if len(self.calls) >= self.calls_per_minute:
+                self.throttled += 1
+                return False
+            self.calls.append(now)
+            return True
+    
+    def respond(self, params):
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        if not self.allow():
+            return json.dumps({'Note': THROTTLE_NOTE}).encode()
+        return self.fixtures.respond(params)
+    
+    def get(self, params, stream=False):
+        return ReplayResponse(self.respond(params))
+
+
+class RecordingProvider:
+    """Provider wrapper saving every successful response as a fixture file
+    
+    Bulk quote responses are not saved; FixtureSet assembles them from the
+    recorded per-symbol quotes.
+    """
+    
+    def __init__(self, provider, directory):
+        self.provider = provider
+        self.directory = directory
+        self.fixtures = FixtureSet(directory)
+    
+    def get(self, params, stream=False):
+        with self.provider.get(params) as response:
+            content = response.content
+        
+        function = params.get('function')
+        symbol = params.get('symbol', '')
+        try:
+            data = json.loads(content)
+        except ValueError:
+            data = {}
+        if data and ',' not in symbol and not any(key in data for key in ('Note', 'Information', 'Error Message')):
+            path = self.fixtures.path(function, symbol)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(content)
+        return ReplayResponse(content)
+
+
+class ReplayServer:
+    """Local HTTP server answering Alpha Vantage queries from a ReplayProvider
+    
+    Point portfolio_core.HttpProvider at `url` to measure the full HTTP path
+    (connection reuse, transfer, streaming) without touching the real API.
+    """
+    
+    def __init__(self, provider, host='127.0.0.1', port=0):
+        self.provider = provider
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                body = provider.respond({key: values[0] for key, values in query.items()})
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+    
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/query"
+    
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -1,17 +1,170 @@
+import time
+
+# Taken before the other imports, so --startup-time covers them too
+STARTED = time.perf_counter()
+
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
-import requests
-import json
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import pandas as pd
-from datetime import datetime, timedelta
-import os
+from tkinter import ttk, messagebox, simpledialog, filedialog
+import argparse
+from datetime import datetime
+import logging
+import math
+import queue
 import threading
-import time
+from portfolio_core import (
+    ANALYTICS_DAYS, API_CALLS_PER_DAY, API_CALLS_PER_MINUTE, AlphaVantageClient, PortfolioLedger, PortfolioStore,
+    RefreshScheduler, metrics
+)
+
+logger = logging.getLogger("stock-portfolio-tracker")
+
+# How often the Tk thread drains results posted by worker threads (~60 fps)
+UI_POLL_INTERVAL = 16
+UI_FRAME_BUDGET = 0.008
+
+# Chart redraws are merged to at most one per frame interval (ms); smaller
+# holdings beyond CHART_MAX_SLICES are shown as a single "Other" slice/bar
+CHART_FRAME_INTERVAL = 33
+CHART_MAX_SLICES = 12
+
+# How often an open diagnostics window re-reads the metrics (ms)
+DIAGNOSTICS_INTERVAL = 1000
+
+
+def load_chart_modules():
+    """Import matplotlib's Figure and Tk canvas classes
+    
+    matplotlib takes most of the startup time, so it is imported on first use
+    (first from a background thread right after the window appears).
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    return Figure, FigureCanvasTkAgg
+
+
+class PortfolioCharts:
+    """Portfolio composition pie and value bar charts, updated in place"""
+    
+    def __init__(self, root, master, max_slices=CHART_MAX_SLICES, frame_interval=CHART_FRAME_INTERVAL):
+        self.root = root
+        self.max_slices = max_slices
+        self.frame_interval = frame_interval
+        
+        Figure, FigureCanvasTkAgg = load_chart_modules()
+        
+        # Create figure for the charts
+        self.figure = Figure(figsize=(12, 4))
+        self.ax1, self.ax2 = self.figure.subplots(1, 2)
+        
+        # Setup canvas
+        self.canvas = FigureCanvasTkAgg(self.figure, master)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        
+        # draw_idle renders later from the Tk loop; time the actual render
+        self.canvas.draw = metrics.timed('canvas_draw')(self.canvas.draw)
+        
+        # Artists of the current charts, reused while the set of labels is unchanged
+        self.labels = None
+        self.wedges = []
+        self.label_texts = []
+        self.pct_texts = []
+        self.bars = []
+        
+        self.pending = None
+        self.after_id = None
+    
+    def update(self, symbols, values):
+        """Schedule a redraw; updates arriving within one frame interval are merged"""
+        self.pending = (list(symbols), list(values))
+        if self.after_id is None:
+            self.after_id = self.root.after(self.frame_interval, self.flush)
+    
+    @metrics.timed('chart_flush')
+    def flush(self):
+        """Apply the latest pending update and request a redraw"""
+        self.after_id = None
+        if self.pending is None:
+            return
+        symbols, values = self.pending
+        self.pending = None
+        
+        if not symbols or sum(values) <= 0:
+            labels, values = None, []
+        else:
+            labels, values = self.group_small_holdings(symbols, values)
+        
+        if labels is not None and labels == self.labels:
+            self.update_artists(values)
+        else:
+            self.rebuild(labels, values)
+        
+        # Let Tk coalesce the actual render with other idle work
+        self.canvas.draw_idle()
+    
+    def group_small_holdings(self, symbols, values):
+        """Keep the largest holdings in portfolio order and merge the rest into "Other" """
+        if len(symbols) <= self.max_slices:
+            return symbols, values
+        
+        ranked = sorted(range(len(values)), key=values.__getitem__, reverse=True)
+        keep = set(ranked[:self.max_slices - 1])
+        labels = [symbols[i] for i in range(len(symbols)) if i in keep] + ["Other"]
+        grouped = [values[i] for i in range(len(values)) if i in keep]
+        grouped.append(sum(values[i] for i in ranked[self.max_slices - 1:]))
+        return labels, grouped
+    
+    def rebuild(self, labels, values):
+        """Create the chart artists from scratch (the set of labels changed)"""
+        self.ax1.clear()
+        self.ax2.clear()
+        self.labels = labels
+        self.wedges, self.label_texts, self.pct_texts, self.bars = [], [], [], []
+        
+        if labels:
+            # Pie chart for portfolio composition
+            self.wedges, self.label_texts, self.pct_texts = self.ax1.pie(
+                values, 
+                labels=labels, 
+                autopct='%1.1f%%', 
+                startangle=90
+            )
+            self.ax1.set_title('Portfolio Composition')
+            
+            # Bar chart for stock values
+            self.bars = list(self.ax2.bar(labels, values, color='skyblue'))
+            self.ax2.set_title('Stock Values')
+            self.ax2.set_ylabel('Value ($)')
+            self.ax2.tick_params(axis='x', rotation=45)
+        
+        # Adjust layout
+        self.figure.tight_layout()
+    
+    def update_artists(self, values):
+        """Move the existing wedges, labels and bars to the new values"""
+        total = float(sum(values))
+        theta1 = 90.0
+        for wedge, label, pct, value in zip(self.wedges, self.label_texts, self.pct_texts, values):
+            theta2 = theta1 + 360.0 * value / total
+            wedge.set_theta1(theta1)
+            wedge.set_theta2(theta2)
+            
+            # Same placement rules as Axes.pie
+            middle = math.radians((theta1 + theta2) / 2)
+            x, y = math.cos(middle), math.sin(middle)
+            label.set_position((1.1 * x, 1.1 * y))
+            label.set_horizontalalignment('left' if x > 0 else 'right')
+            pct.set_position((0.6 * x, 0.6 * y))
+            pct.set_text(f"{100.0 * value / total:.1f}%")
+            theta1 = theta2
+        
+        for bar, value in zip(self.bars, values):
+            bar.set_height(value)
+        self.ax2.relim()
+        self.ax2.autoscale_view()
+
 
 class StockPortfolioTracker:
-    def __init__(self, root):
+    def __init__(self, root, client=None, measure_startup=False):
         self.root = root
         self.root.title("Stock Portfolio Tracker")
         self.root.geometry("1200x800")
@@ -21,18 +174,42 @@ class StockPortfolioTracker:
         # Note: In a real app, you would store this more securely
         self.api_key = " ZKHIYU9Z339WCXAG"
         
+        # Rate-limited API access with the metadata cache and price history store
+        # (the benchmark passes a client backed by a replay provider)
+        self.client = client if client is not None else AlphaVantageClient(self.api_key)
+        
         # Portfolio data
-        self.portfolio = []
+        self.portfolio = PortfolioLedger()
+        self.portfolio_store = PortfolioStore()
         self.load_portfolio()
         
+        # Results from worker threads are applied on the Tk thread via this queue
+        self.ui_queue = queue.Queue()
+        self.active_tasks = set()
+        self.refresh_task = None
+        self.display_dirty = False
+        
+        # Background refresh of stale quotes, paced to the API budget
+        self.scheduler = RefreshScheduler(
+            lambda symbol, cancel_event: self.client.fetch_stock_data(symbol, False, cancel_event),
+            lambda symbol, stock_data: self.post_to_ui(self.apply_scheduled_quote, symbol, stock_data),
+            API_CALLS_PER_MINUTE, API_CALLS_PER_DAY,
+            price_history=self.client.price_history
+        )
+        
+        # Seconds since process start of each startup milestone
+        self.measure_startup = measure_startup
+        self.startup_times = {}
+        
         # Create UI
         self.create_widgets()
+        self.root.after(UI_POLL_INTERVAL, self.process_ui_queue)
+        
+        # Charts are built once the window is up and matplotlib has loaded
+        self.root.after_idle(self.load_charts)
         
         # Start auto-refresh thread
-        self.stop_thread = False
-        self.refresh_thread = threading.Thread(target=self.auto_refresh)
-        self.refresh_thread.daemon = True
-        self.refresh_thread.start()
+        self.scheduler.start()
     
     def create_widgets(self):
         # Main frame
@@ -63,6 +240,21 @@ class StockPortfolioTracker:
         details_button = ttk.Button(control_frame, text="View Details", command=self.view_stock_details)
         details_button.grid(row=0, column=3, padx=5, pady=5)
         
+        # Portfolio analytics button
+        analytics_button = ttk.Button(control_frame, text="Analytics", command=self.view_analytics)
+        analytics_button.grid(row=0, column=4, padx=5, pady=5)
+        
+        # Timing and counter diagnostics button
+        diagnostics_button = ttk.Button(control_frame, text="Diagnostics", command=self.view_diagnostics)
+        diagnostics_button.grid(row=0, column=5, padx=5, pady=5)
+        
+        # Background work progress and cancellation
+        self.progress = ttk.Progressbar(control_frame, length=200, mode="determinate")
+        self.progress.grid(row=0, column=6, padx=5, pady=5)
+        
+        self.cancel_button = ttk.Button(control_frame, text="Cancel", command=self.cancel_background_tasks, state=tk.DISABLED)
+        self.cancel_button.grid(row=0, column=7, padx=5, pady=5)
+        
         # Portfolio table
         portfolio_frame = ttk.LabelFrame(main_frame, text="Current Portfolio")
         portfolio_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -71,6 +263,14 @@ class StockPortfolioTracker:
         columns = ("Symbol", "Name", "Shares", "Buy Price", "Current Price", "Value", "Gain/Loss", "Gain/Loss %")
         self.portfolio_tree = ttk.Treeview(portfolio_frame, columns=columns, show="headings")
         
+        # Configure tag colors
+        self.portfolio_tree.tag_configure("gain", foreground="green")
+        self.portfolio_tree.tag_configure("loss", foreground="red")
+        
+        # symbol -> treeview item id and displayed row, for incremental updates
+        self.tree_items = {}
+        self.tree_rows = {}
+        
         # Set column headings
         for col in columns:
             self.portfolio_tree.heading(col, text=col)
@@ -105,15 +305,53 @@ class StockPortfolioTracker:
         chart_frame = ttk.LabelFrame(main_frame, text="Portfolio Visualization")
         chart_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
-        # Create figure for the charts
-        self.figure, (self.ax1, self.ax2) = plt.subplots(1, 2, figsize=(12, 4))
-        
-        # Setup canvas
-        self.canvas = FigureCanvasTkAgg(self.figure, chart_frame)
-        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        # The charts replace this placeholder once matplotlib has loaded
+        self.chart_frame = chart_frame
+        self.charts = None
+        self.pending_chart_update = None
+        self.chart_placeholder = ttk.Label(chart_frame, text="Loading charts...")
+        self.chart_placeholder.pack(pady=20)
         
         # Initial update
         self.update_portfolio_display()
+        self.mark_startup("table")
+    
+    def mark_startup(self, milestone):
+        """Record the time since process start at which a startup milestone was reached"""
+        elapsed = time.perf_counter() - STARTED
+        self.startup_times[milestone] = elapsed
+        metrics.observe(f"startup_{milestone}", elapsed)
+    
+    def load_charts(self):
+        """Import matplotlib on a worker thread, then build the charts on the Tk thread"""
+        self.mark_startup("first_frame")
+        
+        def worker():
+            try:
+                load_chart_modules()
+            except Exception as e:
+                logger.error(f"Error loading matplotlib: {str(e)}")
+                return
+            self.post_to_ui(self.create_charts)
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def create_charts(self):
+        """Replace the placeholder with the charts and draw the current portfolio"""
+        self.chart_placeholder.destroy()
+        self.charts = PortfolioCharts(self.root, self.chart_frame)
+        
+        if self.pending_chart_update is not None:
+            self.charts.update(*self.pending_chart_update)
+            self.pending_chart_update = None
+            self.charts.flush()
+        self.charts.canvas.draw()
+        self.mark_startup("charts")
+        
+        if self.measure_startup:
+            for milestone, elapsed in self.startup_times.items():
+                print(f"{milestone}: {elapsed:.3f}s")
+            self.root.after_idle(self.on_close)
     
     def add_stock(self):
         # Prompt for stock details
@@ -123,15 +361,28 @@ class StockPortfolioTracker:
         
         symbol = symbol.upper()
         
-        # Check if stock already exists in portfolio
-        for stock in self.portfolio:
-            if stock['symbol'] == symbol:
-                messagebox.showerror("Error", f"Stock {symbol} already exists in portfolio!")
+        # A stock already in the portfolio gets another purchase lot
+        if symbol in self.portfolio:
+            add_lot = messagebox.askyesno("Add Stock", f"{symbol} is already in portfolio. Add another purchase lot?")
+            if not add_lot:
                 return
         
-        # Validate symbol using API
+        # Validate symbol using API off the UI thread
+        self.last_update_label.config(text=f"Looking up {symbol}...")
+        self.run_in_background(
+            self.fetch_stock_data,
+            lambda stock_data, cancelled: self.finish_add_stock(symbol, stock_data, cancelled),
+            symbol
+        )
+    
+    def finish_add_stock(self, symbol, stock_data, cancelled):
+        """Complete add_stock once the symbol lookup has returned"""
+        if cancelled:
+            return
+        
         try:
-            stock_data = self.fetch_stock_data(symbol)
+            if isinstance(stock_data, Exception):
+                raise stock_data
             if not stock_data:
                 messagebox.showerror("Error", f"Could not find stock with symbol {symbol}")
                 return
@@ -148,17 +399,13 @@ class StockPortfolioTracker:
             if buy_price is None:
                 return
             
-            # Add stock to portfolio
-            stock_info = {
-                'symbol': symbol,
-                'name': name,
-                'shares': shares,
-                'buy_price': buy_price,
-                'current_price': current_price
-            }
-            
-            self.portfolio.append(stock_info)
+            # Add a purchase lot to portfolio
+            self.portfolio.add_lot(
+                symbol, shares, buy_price, name=name, current_price=current_price,
+                bought_at=datetime.now().strftime("%Y-%m-%d")
+            )
             self.save_portfolio()
+            self.client.metadata_cache.save()
             self.update_portfolio_display()
             
             messagebox.showinfo("Success", f"Added {shares} shares of {symbol} to portfolio!")
@@ -183,10 +430,7 @@ class StockPortfolioTracker:
             return
         
         # Remove from portfolio
-        for i, stock in enumerate(self.portfolio):
-            if stock['symbol'] == symbol:
-                self.portfolio.pop(i)
-                break
+        self.portfolio.remove_position(symbol)
         
         self.save_portfolio()
         self.update_portfolio_display()
@@ -208,28 +452,49 @@ class StockPortfolioTracker:
         details_window.title(f"{symbol} Details")
         details_window.geometry("800x600")
         
-        # Fetch historical data
+        # Fetch historical data in the background
+        loading_label = ttk.Label(details_window, text=f"Loading {symbol} history...")
+        loading_label.pack(pady=20)
+        
+        task = self.run_in_background(
+            self.fetch_historical_data,
+            lambda historical_data, cancelled: self.show_stock_history(details_window, loading_label, symbol, historical_data),
+            symbol
+        )
+        
+        # Closing the window abandons the fetch
+        def close_details():
+            task.set()
+            details_window.destroy()
+        details_window.protocol("WM_DELETE_WINDOW", close_details)
+    
+    def show_stock_history(self, details_window, loading_label, symbol, historical_data):
+        """Render the details window once the historical data has arrived"""
+        if not details_window.winfo_exists():
+            return
+        loading_label.destroy()
+        
         try:
-            historical_data = self.fetch_historical_data(symbol)
+            if isinstance(historical_data, Exception):
+                raise historical_data
             
             # Create detail view
             ttk.Label(details_window, text=f"{symbol} Historical Performance", font=("Arial", 16, "bold")).pack(pady=10)
             
             # Create figure for historical chart
-            fig, ax = plt.subplots(figsize=(8, 5))
+            Figure, FigureCanvasTkAgg = load_chart_modules()
+            fig = Figure(figsize=(8, 5))
+            ax = fig.subplots()
             
             # Plot data
-            if historical_data:
-                dates = [d['date'] for d in historical_data]
-                prices = [d['close'] for d in historical_data]
-                
-                ax.plot(dates, prices)
+            if len(historical_data):
+                ax.plot(historical_data['date'], historical_data['close'])
                 ax.set_title(f"{symbol} Price History")
                 ax.set_xlabel("Date")
                 ax.set_ylabel("Price ($)")
                 ax.grid(True)
-                plt.xticks(rotation=45)
-                plt.tight_layout()
+                ax.tick_params(axis='x', rotation=45)
+                fig.tight_layout()
                 
                 # Add chart to window
                 canvas = FigureCanvasTkAgg(fig, master=details_window)
@@ -241,73 +506,167 @@ class StockPortfolioTracker:
         except Exception as e:
             ttk.Label(details_window, text=f"Error fetching details: {str(e)}").pack(pady=20)
     
-    def fetch_stock_data(self, symbol):
-        """Fetch current stock data from Alpha Vantage API"""
-        try:
-            # Endpoint for current price (Global Quote)
-            url = f"https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={symbol}&apikey={self.api_key}"
-            response = requests.get(url)
-            data = response.json()
-            
-            # Extract relevant data
-            if 'Global Quote' in data and data['Global Quote']:
-                quote = data['Global Quote']
-                price = float(quote.get('05. price', 0))
-                
-                # Get company name using OVERVIEW endpoint
-                overview_url = f"https://www.alphavantage.co/query?function=OVERVIEW&symbol={symbol}&apikey={self.api_key}"
-                overview_response = requests.get(overview_url)
-                overview_data = overview_response.json()
-                name = overview_data.get('Name', symbol)
-                
-                return {
-                    'symbol': symbol,
-                    'name': name,
-                    'price': price
-                }
-            else:
-                if 'Note' in data:
-                    print(f"API limit reached: {data['Note']}")
+    def view_analytics(self):
+        """Show risk statistics of the whole portfolio"""
+        if not self.portfolio:
+            messagebox.showinfo("Info", " portfolio is empty!")
+            return
+        
+        analytics_window = tk.Toplevel(self.root)
+        analytics_window.title("Portfolio Analytics")
+        analytics_window.geometry("900x600")
+        
+        loading_label = ttk.Label(analytics_window, text="Loading price history...")
+        loading_label.pack(pady=20)
+        
+        shares = {position.symbol: position.shares for position in self.portfolio}
+        current_prices = {position.symbol: position.price for position in self.portfolio}
+        
+        task = self.run_in_background(
+            self.compute_analytics,
+            lambda result, cancelled: self.show_analytics(analytics_window, loading_label, result),
+            shares,
+            current_prices
+        )
+        
+        def close_analytics():
+            task.set()
+            analytics_window.destroy()
+        analytics_window.protocol("WM_DELETE_WINDOW", close_analytics)
+    
+    def compute_analytics(self, shares, current_prices=None, cancel_event=None):
+        """Worker thread: sync missing history, then compute the statistics"""
+        # pandas is only needed here, so it isn't imported at startup
+        import portfolio_analytics
+        
+        for symbol, bars in self.client.history_engine.refresh(shares, cancel_event):
+            if cancel_event is not None and cancel_event.is_set():
                 return None
-        except Exception as e:
-            print(f"Error fetching stock data: {str(e)}")
-            return None
+        
+        return portfolio_analytics.analyze_holdings(
+            shares, self.client.price_history.path, ANALYTICS_DAYS, current_prices=current_prices
+        )
     
-    def fetch_historical_data(self, symbol, days=30):
-        """Fetch historical stock data from Alpha Vantage API"""
-        try:
-            # Endpoint for historical data (TIME_SERIES_DAILY)
-            url = f"https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol={symbol}&outputsize=compact&apikey={self.api_key}"
-            response = requests.get(url)
-            data = response.json()
+    def show_analytics(self, analytics_window, loading_label, result):
+        """Render the analytics window once the statistics are computed"""
+        if not analytics_window.winfo_exists():
+            return
+        loading_label.destroy()
+        
+        if result is None:
+            return
+        if isinstance(result, Exception):
+            ttk.Label(analytics_window, text=f"Error computing analytics: {str(result)}").pack(pady=20)
+            return
+        
+        per_symbol, summary = result
+        
+        ttk.Label(analytics_window, text="Portfolio Risk", font=("Arial", 16, "bold")).pack(pady=10)
+        summary_text = (
+            f"Volatility (annualized): {summary['volatility']:.2%}    "
+            f"Max Drawdown: {summary['max_drawdown']:.2%}    "
+            f"1-day VaR ({summary['confidence']:.0%}): ${summary['var']:.2f}    "
+            f"Days: {summary['days']}"
+        )
+        ttk.Label(analytics_window, text=summary_text).pack(pady=5)
+        
+        # Per-holding statistics
+        columns = ("Symbol", "Weight", "Volatility", "Max Drawdown", "Beta")
+        tree = ttk.Treeview(analytics_window, columns=columns, show="headings")
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=120)
+        
+        for symbol, row in per_symbol.iterrows():
+            tree.insert("", tk.END, values=(
+                symbol,
+                f"{row['weight']:.2%}",
+                f"{row['volatility']:.2%}",
+                f"{row['max_drawdown']:.2%}",
+                f"{row['beta']:.2f}"
+            ))
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+    
+    def view_diagnostics(self):
+        """Show timings of the hot paths and the API/cache counters"""
+        diagnostics_window = tk.Toplevel(self.root)
+        diagnostics_window.title("Diagnostics")
+        diagnostics_window.geometry("800x600")
+        
+        # Timing spans
+        spans_frame = ttk.LabelFrame(diagnostics_window, text="Timings")
+        spans_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        span_columns = ("Span", "Count", "Total (ms)", "Mean (ms)", "Max (ms)", "Last (ms)")
+        spans_tree = ttk.Treeview(spans_frame, columns=span_columns, show="headings")
+        for col in span_columns:
+            spans_tree.heading(col, text=col)
+            spans_tree.column(col, width=180 if col == "Span" else 100)
+        spans_tree.pack(fill=tk.BOTH, expand=True)
+        
+        # Counters
+        counters_frame = ttk.LabelFrame(diagnostics_window, text="Counters")
+        counters_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        counter_columns = ("Counter", "Labels", "Value")
+        counters_tree = ttk.Treeview(counters_frame, columns=counter_columns, show="headings")
+        for col in counter_columns:
+            counters_tree.heading(col, text=col)
+            counters_tree.column(col, width=250 if col == "Labels" else 150)
+        counters_tree.pack(fill=tk.BOTH, expand=True)
+        
+        def refresh_view():
+            if not diagnostics_window.winfo_exists():
+                return
+            snapshot = metrics.snapshot()
             
-            if 'Time Series (Daily)' in data:
-                time_series = data['Time Series (Daily)']
-                historical_data = []
-                
-                # Convert to list and sort by date
-                for date, values in time_series.items():
-                    historical_data.append({
-                        'date': date,
-                        'open': float(values['1. open']),
-                        'high': float(values['2. high']),
-                        'low': float(values['3. low']),
-                        'close': float(values['4. close']),
-                        'volume': int(values['5. volume'])
-                    })
-                
-                # Sort by date
-                historical_data.sort(key=lambda x: x['date'])
-                
-                # Limit to last X days
-                return historical_data[-days:]
-            else:
-                if 'Note' in data:
-                    print(f"API limit reached: {data['Note']}")
-                return []
-        except Exception as e:
-            print(f"Error fetching historical data: {str(e)}")
-            return []
+            spans_tree.delete(*spans_tree.get_children())
+            for name, span in snapshot['spans'].items():
+                spans_tree.insert("", tk.END, values=(
+                    name,
+                    span['count'],
+                    f"{span['total'] * 1000:.1f}",
+                    f"{span['mean'] * 1000:.2f}",
+                    f"{span['max'] * 1000:.2f}",
+                    f"{span['last'] * 1000:.2f}"
+                ))
+            
+            counters_tree.delete(*counters_tree.get_children())
+            for counter in snapshot['counters']:
+                labels = ", ".join(f"{key}={value}" for key, value in counter['labels'].items())
+                counters_tree.insert("", tk.END, values=(counter['name'], labels, counter['value']))
+            
+            diagnostics_window.after(DIAGNOSTICS_INTERVAL, refresh_view)
+        
+        def export(extension, file_type):
+            path = filedialog.asksaveasfilename(
+                parent=diagnostics_window,
+                defaultextension=extension,
+                filetypes=[(file_type, f"*{extension}"), ("All files", "*.*")]
+            )
+            if not path:
+                return
+            try:
+                metrics.export(path)
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to export metrics: {str(e)}", parent=diagnostics_window)
+        
+        # Export and reset buttons
+        button_frame = ttk.Frame(diagnostics_window)
+        button_frame.pack(fill=tk.X, padx=10, pady=10)
+        ttk.Button(button_frame, text="Export JSON", command=lambda: export(".json", "JSON")).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Export Prometheus", command=lambda: export(".prom", "Prometheus text")).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Reset", command=metrics.reset).pack(side=tk.LEFT, padx=5)
+        
+        refresh_view()
+    
+    def fetch_stock_data(self, symbol, fetch_name=True, cancel_event=None):
+        """Fetch current stock data from Alpha Vantage API"""
+        return self.client.fetch_stock_data(symbol, fetch_name, cancel_event)
+    
+    def fetch_historical_data(self, symbol, days=30, cancel_event=None):
+        """Return the last `days` daily bars of symbol as a structured array"""
+        return self.client.fetch_historical_data(symbol, days, cancel_event)
     
     def refresh_data(self):
         """Refresh stock data for all portfolio items"""
@@ -315,16 +674,66 @@ class StockPortfolioTracker:
             messagebox.showinfo("Info", " portfolio is empty!")
             return
         
+        # Only one refresh at a time
+        if self.refresh_task is not None:
+            return
+        
+        symbols = list(self.portfolio.positions)
+        self.progress.config(maximum=len(symbols), value=0)
+        self.last_update_label.config(text="Refreshing...")
+        self.refresh_task = self.run_in_background(self.fetch_quotes, self.finish_refresh, symbols)
+    
+    def fetch_quotes(self, symbols, cancel_event=None):
+        """Worker thread: fetch quotes concurrently and post each one to the UI as it arrives"""
+        done = 0
+        with metrics.span('refresh'):
+            for symbol, stock_data in self.client.refresh_quotes(symbols, cancel_event):
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                done += 1
+                self.post_to_ui(self.apply_quote, symbol, stock_data, done)
+        return done
+    
+    def apply_quote(self, symbol, stock_data, done):
+        """Apply one refreshed quote (runs on the Tk thread)"""
+        # The stock may have been removed while the refresh was running
+        position = self.portfolio.get(symbol)
+        if position is not None and stock_data:
+            self.portfolio.update_price(symbol, stock_data['price'], stock_data['name'])
+            self.scheduler.mark_quoted(symbol)
+            self.update_stock_row(position)
+            self.display_dirty = True
+        
+        self.progress.config(value=done)
+    
+    def apply_scheduled_quote(self, symbol, stock_data):
+        """Apply a quote fetched by the background scheduler (runs on the Tk thread)"""
+        position = self.portfolio.get(symbol)
+        if position is None or not stock_data:
+            return
+        
+        self.portfolio.update_price(symbol, stock_data['price'], stock_data['name'])
+        self.update_stock_row(position)
+        self.display_dirty = True
+        self.save_portfolio()
+    
+    def finish_refresh(self, result, cancelled):
+        """Persist and redraw once every quote of a refresh has been applied"""
+        self.refresh_task = None
+        self.display_dirty = False
+        
         try:
-            # Update each stock's current price
-            for stock in self.portfolio:
-                stock_data = self.fetch_stock_data(stock['symbol'])
-                if stock_data:
-                    stock['current_price'] = stock_data['price']
+            if isinstance(result, Exception):
+                raise result
             
             self.save_portfolio()
+            self.client.metadata_cache.save()
             self.update_portfolio_display()
             
+            if cancelled:
+                self.last_update_label.config(text=f"Refresh cancelled after {result} quotes")
+                return
+            
             # Update last refresh time
             now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             self.last_update_label.config(text=f"Last Updated: {now}")
@@ -333,70 +742,126 @@ class StockPortfolioTracker:
         except Exception as e:
             messagebox.showerror("Error", f"Failed to refresh data: {str(e)}")
     
+    def run_in_background(self, task, on_done, *args):
+        """Run task(*args, cancel_event=...) on a worker thread
+        
+        on_done(result, cancelled) is called on the Tk thread afterwards; result is
+        the exception instance if the task raised. Returns the task's cancel event.
+        """
+        cancel_event = threading.Event()
+        self.active_tasks.add(cancel_event)
+        self.cancel_button.config(state=tk.NORMAL)
+        
+        def worker():
+            try:
+                result = task(*args, cancel_event=cancel_event)
+            except Exception as e:
+                result = e
+            self.post_to_ui(self.finish_background_task, cancel_event, on_done, result)
+        
+        threading.Thread(target=worker, daemon=True).start()
+        return cancel_event
+    
+    def finish_background_task(self, cancel_event, on_done, result):
+        self.active_tasks.discard(cancel_event)
+        if not self.active_tasks:
+            self.cancel_button.config(state=tk.DISABLED)
+        on_done(result, cancel_event.is_set())
+    
+    def cancel_background_tasks(self):
+        """Cancel all running background fetches"""
+        for cancel_event in self.active_tasks:
+            cancel_event.set()
+    
+    def post_to_ui(self, callback, *args):
+        """Schedule callback(*args) on the Tk thread; safe to call from any thread"""
+        self.ui_queue.put((callback, args))
+    
+    def process_ui_queue(self):
+        """Run callbacks posted by worker threads, spending at most one frame budget per tick"""
+        deadline = time.monotonic() + UI_FRAME_BUDGET
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    callback, args = self.ui_queue.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    callback(*args)
+                except Exception as e:
+                    logger.exception(f"Error in UI callback: {str(e)}")
+                    metrics.increment('errors', operation='ui_callback')
+            
+            # Coalesce partial refresh results into one summary update per tick
+            if self.display_dirty:
+                self.display_dirty = False
+                self.update_summary()
+        finally:
+            self.root.after(UI_POLL_INTERVAL, self.process_ui_queue)
+    
+    @metrics.timed('update_portfolio_display')
     def update_portfolio_display(self):
         """Update the portfolio treeview and summary"""
-        # Clear existing items
-        for item in self.portfolio_tree.get_children():
-            self.portfolio_tree.delete(item)
-        
-        # Reset summary values
-        total_value = 0
-        total_cost = 0
-        
-        # Stock distribution data for pie chart
-        stock_values = []
-        stock_symbols = []
-        
-        # Add portfolio items to treeview
-        for stock in self.portfolio:
-            symbol = stock['symbol']
-            name = stock['name']
-            shares = stock['shares']
-            buy_price = stock['buy_price']
-            current_price = stock.get('current_price', buy_price)
-            
-            # Calculate values
-            value = shares * current_price
-            cost = shares * buy_price
-            gain_loss = value - cost
-            gain_loss_percent = (gain_loss / cost) * 100 if cost > 0 else 0
-            
-            # Format values
-            value_str = f"${value:.2f}"
-            gain_loss_str = f"${gain_loss:.2f}"
-            gain_loss_percent_str = f"{gain_loss_percent:.2f}%"
-            
-            # Color for gain/loss
-            tag = "gain" if gain_loss >= 0 else "loss"
-            
-            # Insert into treeview
-            item_id = self.portfolio_tree.insert(
-                "", 
-                tk.END, 
-                values=(
-                    symbol, 
-                    name, 
-                    f"{shares:.2f}", 
-                    f"${buy_price:.2f}", 
-                    f"${current_price:.2f}", 
-                    value_str, 
-                    gain_loss_str, 
-                    gain_loss_percent_str
-                ),
-                tags=(tag,)
-            )
-            
-            # Update totals
-            total_value += value
-            total_cost += cost
-            
-            # Add to chart data
-            stock_values.append(value)
-            stock_symbols.append(symbol)
+        # Update rows in place; only rows whose values changed cost a Tk call
+        for position in self.portfolio:
+            self.update_stock_row(position)
         
-        # Configure tag colors
-        self.portfolio_tree.tag_configure("gain", foreground="green")
-        self.portfolio_tree.tag_configure("loss", foreground="red")
+        # Drop rows of stocks no longer in the portfolio
+        for symbol in [symbol for symbol in self.tree_items if symbol not in self.portfolio]:
+            self.remove_stock_row(symbol)
+        
+        self.update_summary()
+    
+    def update_stock_row(self, position):
+        """Insert or update the treeview row of one position"""
+        symbol = position.symbol
+        shares = position.shares
+        buy_price = position.buy_price
+        current_price = position.price
+        
+        # Calculate values
+        value = position.value
+        cost = position.cost
+        gain_loss = value - cost
+        gain_loss_percent = (gain_loss / cost) * 100 if cost > 0 else 0
+        
+        # Color for gain/loss
+        tag = "gain" if gain_loss >= 0 else "loss"
+        
+        row = (
+            (
+                symbol, 
+                position.name, 
+                f"{shares:.2f}", 
+                f"${buy_price:.2f}", 
+                f"${current_price:.2f}", 
+                f"${value:.2f}", 
+                f"${gain_loss:.2f}", 
+                f"{gain_loss_percent:.2f}%"
+            ),
+            tag
+        )
+        
+        item_id = self.tree_items.get(symbol)
+        if item_id is None:
+            self.tree_items[symbol] = self.portfolio_tree.insert("", tk.END, values=row[0], tags=(tag,))
+        elif self.tree_rows[symbol] != row:
+            self.portfolio_tree.item(item_id, values=row[0], tags=(tag,))
+        self.tree_rows[symbol] = row
+    
+    def remove_stock_row(self, symbol):
+        """Delete the treeview row of a removed stock"""
+        item_id = self.tree_items.pop(symbol, None)
+        if item_id is None:
+            return
+        self.portfolio_tree.delete(item_id)
+        del self.tree_rows[symbol]
+    
+    @metrics.timed('update_summary')
+    def update_summary(self):
+        """Update the summary labels and charts from the ledger's running totals"""
+        total_value = self.portfolio.total_value
+        total_cost = self.portfolio.total_cost
         
         # Update summary labels
         total_gain_loss = total_value - total_cost
@@ -417,75 +882,55 @@ class StockPortfolioTracker:
         self.last_update_label.config(text=f"Last Updated: {now}")
         
         # Update charts
+        stock_symbols = list(self.portfolio.positions)
+        stock_values = [position.value for position in self.portfolio]
         self.update_charts(stock_symbols, stock_values)
+        
+        # Keep the scheduler's view of holdings and their sizes current
+        self.scheduler.set_holdings(dict(zip(stock_symbols, stock_values)))
     
+    @metrics.timed('update_charts')
     def update_charts(self, symbols, values):
         """Update portfolio visualization charts"""
-        # Clear previous charts
-        self.ax1.clear()
-        self.ax2.clear()
-        
-        if not symbols:
-            self.canvas.draw()
+        # Until the charts exist, keep only the latest values for their first draw
+        if self.charts is None:
+            self.pending_chart_update = (symbols, values)
             return
-        
-        # Pie chart for portfolio composition
-        if sum(values) > 0:
-            self.ax1.pie(
-                values, 
-                labels=symbols, 
-                autopct='%1.1f%%', 
-                startangle=90, 
-                shadow=True
-            )
-            self.ax1.set_title('Portfolio Composition')
-            
-            # Bar chart for stock values
-            self.ax2.bar(symbols, values, color='skyblue')
-            self.ax2.set_title('Stock Values')
-            self.ax2.set_ylabel('Value ($)')
-            self.ax2.tick_params(axis='x', rotation=45)
-        
-        # Adjust layout
-        plt.tight_layout()
-        
-        # Draw the updated charts
-        self.canvas.draw()
+        self.charts.update(symbols, values)
     
     def load_portfolio(self):
-        """Load portfolio data from file"""
+        """Load portfolio data from the database"""
         try:
-            if os.path.exists('portfolio.json'):
-                with open('portfolio.json', 'r') as f:
-                    self.portfolio = json.load(f)
+            self.portfolio = self.portfolio_store.load()
         except Exception as e:
-            print(f"Error loading portfolio: {str(e)}")
-            self.portfolio = []
+            logger.error(f"Error loading portfolio: {str(e)}")
+            metrics.increment('errors', operation='load_portfolio')
+            self.portfolio = PortfolioLedger()
     
+    @metrics.timed('save_portfolio')
     def save_portfolio(self):
-        """Save portfolio data to file"""
+        """Save changed portfolio records to the database"""
         try:
-            with open('portfolio.json', 'w') as f:
-                json.dump(self.portfolio, f, indent=4)
+            self.portfolio_store.sync(self.portfolio)
         except Exception as e:
-            print(f"Error saving portfolio: {str(e)}")
-    
-    def auto_refresh(self):
-        """Auto refresh thread function - refreshes data every hour"""
-        while not self.stop_thread:
-            time.sleep(3600)  # Sleep for 1 hour
-            if not self.stop_thread:
-                # Run refresh on main thread
-                self.root.after(0, self.refresh_data)
+            logger.error(f"Error saving portfolio: {str(e)}")
+            metrics.increment('errors', operation='save_portfolio')
     
     def on_close(self):
         """Handle window close event"""
-        self.stop_thread = True
+        self.scheduler.stop()
+        self.cancel_background_tasks()
         self.save_portfolio()
+        self.client.metadata_cache.save()
         self.root.destroy()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stock Portfolio Tracker")
+    parser.add_argument("--startup-time", action="store_true", help="Print the startup milestones (table, first frame, charts) and exit")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
     root = tk.Tk()
-    app = StockPortfolioTracker(root)
+    app = StockPortfolioTracker(root, measure_startup=args.startup_time)
     root.protocol("WM_DELETE_WINDOW", app.on_close)
     root.mainloop()
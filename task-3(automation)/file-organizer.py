@@ -7,13 +7,118 @@ based on their file extensions.
 """
 
 import os
+import errno
+import sys
+import re
+import json
 import shutil
+import hashlib
+import signal
+import fnmatch
 import argparse
 import logging
+import threading
+import select
+import struct
+import ctypes
+import ctypes.util
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from datetime import datetime
 import time
 from pathlib import Path
 
+# Bytes read from the start of a file when sniffing its type (tar's magic sits at 257)
+SNIFF_BYTES = 512
+
+# Files whose type was sniffed are remembered between runs, up to this many
+SNIFF_CACHE_MAX_ENTRIES = 200000
+
+# Magic-byte signatures: (regex for the start of the file, extension it stands for).
+# Order matters where one signature is a prefix of another (RIFF, ftyp).
+SIGNATURES = [
+    (rb"\x89PNG\r\n\x1a\n", ".png"),
+    (rb"\xff\xd8\xff", ".jpg"),
+    (rb"GIF8[79]a", ".gif"),
+    (rb"RIFF.{4}WEBP", ".webp"),
+    (rb"RIFF.{4}WAVE", ".wav"),
+    (rb"RIFF.{4}AVI ", ".avi"),
+    (rb"II\*\x00|MM\x00\*", ".tiff"),
+    (rb"BM.{4}\x00\x00\x00\x00", ".bmp"),
+    (rb"%PDF-", ".pdf"),
+    (rb"\{\\rtf", ".rtf"),
+    (rb"PK\x03\x04.{26}mimetypeapplication/vnd\.oasis\.opendocument\.text", ".odt"),
+    (rb"PK\x03\x04.{26}\[Content_Types\]\.xml", ".docx"),
+    (rb"PK\x03\x04", ".zip"),
+    (rb"Rar!\x1a\x07", ".rar"),
+    (rb"7z\xbc\xaf\x27\x1c", ".7z"),
+    (rb"\x1f\x8b", ".gz"),
+    (rb"BZh[1-9]", ".bz2"),
+    (rb".{257}ustar", ".tar"),
+    (rb".{4}ftyp(?:M4A |M4B )", ".m4a"),
+    (rb".{4}ftypqt  ", ".mov"),
+    (rb".{4}ftyp", ".mp4"),
+    (rb"\x1a\x45\xdf\xa3.{0,64}webm", ".webm"),
+    (rb"\x1a\x45\xdf\xa3", ".mkv"),
+    (rb"FLV\x01", ".flv"),
+    (rb"\x30\x26\xb2\x75\x8e\x66\xcf\x11", ".wmv"),
+    (rb"ID3|\xff[\xfb\xf3\xf2]", ".mp3"),
+    (rb"fLaC", ".flac"),
+    (rb"OggS", ".ogg"),
+    (rb"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", ".doc"),
+    (rb"#![^\n]*python", ".py"),
+    (rb"(?:\xef\xbb\xbf)?\s*<\?xml", ".xml"),
+    (rb"(?:\xef\xbb\xbf)?\s*<(?i:!doctype html|html)", ".html"),
+]
+
+# Moves executed between journal checkpoints
+MOVE_BATCH_SIZE = 1000
+
+# Journal of completed runs, kept in the organized directory (hidden, so never organized itself)
+JOURNAL_NAME = ".file-organizer-journal"
+
+# Dedupe: bytes hashed from each end of a file before hashing all of it
+DEDUPE_BLOCK_SIZE = 64 * 1024
+
+# Dedupe: read size when hashing whole files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Dedupe: threads reading the first/last blocks (latency bound, so more than the cores)
+DEDUPE_READERS = 8
+
+# Cross-device moves: bytes copied per system call, between progress updates
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Cross-device moves: seconds between progress reports of long copies
+PROGRESS_INTERVAL = 5.0
+
+# ioctl cloning a file's blocks (reflink) on btrfs, XFS and others
+FICLONE = 0x40049409
+
+# Watch mode: seconds a new file must stay unchanged before it is moved
+WATCH_SETTLE_SECONDS = 2.0
+
+# Watch mode without inotify: seconds between directory scans
+WATCH_POLL_SECONDS = 5.0
+
+# Watch mode: seconds between statistics reports
+WATCH_REPORT_SECONDS = 300.0
+
+# Names downloads and copies use while incomplete; the final name arrives by rename
+PARTIAL_SUFFIXES = (".part", ".partial", ".crdownload", ".download", ".tmp", ".!qb", ".opdownload")
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
 
 def setup_logger():
     """Set up logging configuration."""
@@ -34,6 +139,1175 @@ def setup_logger():
     return logging.getLogger(__name__)
 
 
+def parse_size(value):
+    """Convert a size such as 1048576, "500KB" or "1.5GB" to bytes."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    
+    text = str(value).strip().upper().rstrip("B")
+    for suffix, factor in (("K", 1024), ("M", 1024 ** 2), ("G", 1024 ** 3), ("T", 1024 ** 4)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * factor)
+    return int(float(text))
+
+
+def load_rules_file(path):
+    """Read a rules file as a dict; TOML for .toml files, JSON otherwise."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    
+    if str(path).lower().endswith(".toml"):
+        if tomllib is None:
+            raise ValueError("TOML rules files need Python 3.11+ or the 'tomli' package; use JSON instead")
+        return tomllib.loads(raw.decode("utf-8"))
+    return json.loads(raw)
+
+
+class Rule:
+    """One classification rule: a category and the conditions a file must meet.
+    
+    Each condition type (names, extensions, globs, regexes, size, age) must
+    hold; a list within one condition matches if any entry matches.
+    """
+    
+    __slots__ = ("index", "category", "names", "extensions", "glob_re", "regex_re",
+                 "min_size", "max_size", "min_age", "max_age")
+    
+    def __init__(self, index, config):
+        category = config.get("category")
+        _check_category(category, f"Rule {index + 1}: 'category'")
+        
+        self.index = index
+        self.category = category
+        self.names = frozenset(name.lower() for name in _as_list(config.get("name")))
+        self.extensions = frozenset(_normalize_extension(ext) for ext in _as_list(config.get("extensions")))
+        
+        globs = _as_list(config.get("glob"))
+        regexes = _as_list(config.get("regex"))
+        try:
+            self.glob_re = re.compile("|".join(fnmatch.translate(g.lower()) for g in globs), re.IGNORECASE) if globs else None
+            self.regex_re = re.compile("|".join(f"(?:{r})" for r in regexes), re.IGNORECASE) if regexes else None
+        except re.error as e:
+            raise ValueError(f"Rule {index + 1}: invalid pattern: {str(e)}")
+        
+        self.min_size = parse_size(config["min_size"]) if "min_size" in config else None
+        self.max_size = parse_size(config["max_size"]) if "max_size" in config else None
+        self.min_age = float(config["older_than_days"]) * 86400 if "older_than_days" in config else None
+        self.max_age = float(config["newer_than_days"]) * 86400 if "newer_than_days" in config else None
+        
+        if not (self.names or self.extensions or globs or regexes or self.needs_stat):
+            raise ValueError(f"Rule {index + 1}: no conditions given")
+    
+    @property
+    def needs_stat(self):
+        return any(limit is not None for limit in (self.min_size, self.max_size, self.min_age, self.max_age))
+    
+    def matches(self, name, suffixes, stat):
+        """Check every condition against a lowercased file name and its stat.
+        
+        Args:
+            name (str): Lowercased file name
+            suffixes (list): Lowercased suffixes of the name, longest first
+            stat (callable): Returns the file's os.stat_result; only called if needed
+            
+        Returns:
+            bool: Whether the file matches the rule
+        """
+        if self.names and name not in self.names:
+            return False
+        if self.extensions and not any(suffix in self.extensions for suffix in suffixes):
+            return False
+        if self.glob_re is not None and not self.glob_re.match(name):
+            return False
+        if self.regex_re is not None and not self.regex_re.search(name):
+            return False
+        
+        if self.needs_stat:
+            if stat is None:
+                return False
+            st = stat()
+            if self.min_size is not None and st.st_size < self.min_size:
+                return False
+            if self.max_size is not None and st.st_size > self.max_size:
+                return False
+            age = time.time() - st.st_mtime
+            if self.min_age is not None and age < self.min_age:
+                return False
+            if self.max_age is not None and age > self.max_age:
+                return False
+        return True
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+def _check_category(category, what):
+    """Raise ValueError unless category can be used as one folder name inside the directory."""
+    if not category or not isinstance(category, str) or "/" in category or "\\" in category or category.startswith("."):
+        raise ValueError(f"{what} must be a folder name, got {category!r}")
+
+
+def _extension_list(extensions, category):
+    """The extensions of an extension map entry as a list, accepting a single string.
+    
+    Raises:
+        ValueError: If they aren't strings
+    """
+    extensions = _as_list(extensions)
+    if not all(isinstance(extension, str) and extension.strip(".") for extension in extensions):
+        raise ValueError(f"'extensions' of {category!r} must be a list of extensions, got {extensions!r}")
+    return extensions
+
+
+def _normalize_extension(extension):
+    extension = extension.lower()
+    return extension if extension.startswith(".") else "." + extension
+
+
+def _glob_prefix(pattern):
+    """Literal start of a glob ("report_*.csv" -> "report_")."""
+    return re.match(r"[^*?\[]*", pattern).group()
+
+
+def _glob_tail(pattern):
+    """Literal end of a glob ("*_draft.doc*" -> "", "*_draft.docx" -> "_draft.docx")."""
+    return re.search(r"[^*?\]]*\Z", pattern).group()
+
+
+def _regex_prefix(pattern):
+    """Literal text every match of a "^..." regex starts with, or "" if unknown."""
+    if not pattern.startswith("^") or "|" in pattern:
+        return ""
+    prefix = re.match(r"[^.^$*+?{}\[\]\\|()]*", pattern[1:]).group()
+    
+    # A quantifier after the literal applies to its last character
+    if prefix and pattern[1 + len(prefix):1 + len(prefix) + 1] in ("*", "?", "{"):
+        prefix = prefix[:-1]
+    return prefix
+
+
+def _uses_groups(pattern):
+    """True if a user regex refers to its own groups (\\1, (?P=name), (?(1)...)) or names one.
+    
+    Such patterns break when their groups are renumbered or renamed by
+    joining them into a combined regex.
+    """
+    return re.search(r"\\[1-9]|\(\?P[<=]|\(\?\(", pattern) is not None
+
+
+class ClassificationRules:
+    """Extension map and user rules compiled into hash lookups.
+    
+    Rules are tried in file order before the extension map; the first rule
+    whose conditions all hold decides the category. Each rule is indexed by
+    one of its conditions: exact names and extensions (including multi-part
+    suffixes like .tar.gz, and globs such as "*.log") go into dicts, globs
+    and "^..." regexes with a literal start or end into dicts keyed by that
+    literal, and the remaining name patterns into a single combined regex.
+    Only the rules a file can possibly match are checked, so the cost per
+    file stays flat as the rule count grows. Rules with nothing but size/age
+    conditions, and patterns without a literal anchor, are checked for every
+    file.
+    """
+    
+    def __init__(self, extension_map, rules=(), default="other"):
+        """Compile the rules.
+        
+        Args:
+            extension_map (dict): Category -> list of extensions; on duplicates the first category wins
+            rules (list): Rule config dicts, in priority order
+            default (str): Category for files nothing matches
+        """
+        _check_category(default, "'default'")
+        self.default = default
+        
+        self.extensions = {}
+        for category, extensions in extension_map.items():
+            _check_category(category, "'extensions' category")
+            for extension in _extension_list(extensions, category):
+                self.extensions.setdefault(_normalize_extension(extension), category)
+        
+        self.rules = [Rule(index, config) for index, config in enumerate(rules)]
+        self.categories = set(extension_map) | {rule.category for rule in self.rules} | {default}
+        
+        # Rule indexes keyed by the condition each rule is indexed under
+        self.by_name = {}
+        self.by_suffix = {}
+        self.by_prefix = {}
+        self.by_tail = {}
+        self.always = []
+        patterns = []
+        for rule, config in zip(self.rules, rules):
+            if rule.names:
+                for name in rule.names:
+                    self.by_name.setdefault(name, []).append(rule.index)
+            elif rule.extensions:
+                for extension in rule.extensions:
+                    self.by_suffix.setdefault(extension, []).append(rule.index)
+            elif rule.glob_re is not None:
+                for pattern in _as_list(config.get("glob")):
+                    pattern = pattern.lower()
+                    if not any(char in pattern for char in "*?["):
+                        self.by_name.setdefault(pattern, []).append(rule.index)
+                    elif pattern.startswith("*.") and not any(char in pattern[1:] for char in "*?["):
+                        self.by_suffix.setdefault(pattern[1:], []).append(rule.index)
+                    elif _glob_prefix(pattern):
+                        self.by_prefix.setdefault(_glob_prefix(pattern), []).append(rule.index)
+                    elif _glob_tail(pattern):
+                        self.by_tail.setdefault(_glob_tail(pattern), []).append(rule.index)
+                    else:
+                        patterns.append((rule.index, fnmatch.translate(pattern), True))
+            elif rule.regex_re is not None:
+                for pattern in _as_list(config.get("regex")):
+                    if _regex_prefix(pattern):
+                        self.by_prefix.setdefault(_regex_prefix(pattern).lower(), []).append(rule.index)
+                    else:
+                        patterns.append((rule.index, f"(?s:.*?(?:{pattern}).*)", not _uses_groups(pattern)))
+            else:
+                self.always.append(rule.index)
+        
+        # Suffixes to try per name; e.g. 2 for ".tar.gz"
+        self.max_suffix_parts = max([suffix.count(".") for suffix in list(self.extensions) + list(self.by_suffix)] or [1])
+        
+        # Lengths of the literal starts/ends to slice off each name
+        self.prefix_lengths = sorted({len(prefix) for prefix in self.by_prefix})
+        self.tail_lengths = sorted({len(tail) for tail in self.by_tail})
+        
+        # All remaining patterns in one regex; the alternative that matched names the rule.
+        # Patterns referring to their own groups are tried one by one next to it.
+        self.pattern_rules = [index for index, pattern, combinable in patterns]
+        self.pattern_res = [re.compile(pattern, re.IGNORECASE) for index, pattern, combinable in patterns]
+        self.separate_patterns = [i for i, (index, pattern, combinable) in enumerate(patterns) if not combinable]
+        self.combined_re = None
+        if len(self.separate_patterns) < len(patterns):
+            try:
+                self.combined_re = re.compile(
+                    "|".join(f"(?P<_r{i}>{pattern})" for i, (index, pattern, combinable) in enumerate(patterns) if combinable),
+                    re.IGNORECASE
+                )
+            except re.error:
+                # Patterns are then tried one by one
+                self.separate_patterns = list(range(len(patterns)))
+    
+    @classmethod
+    def from_config(cls, config, extension_map):
+        """Build rules from a parsed rules file.
+        
+        The file may contain:
+            extensions: category -> list of extensions, merged over the
+                built-in map (taking precedence) unless replace_defaults is true
+            rules: list of rule tables with 'category' and any of 'name',
+                'extensions', 'glob', 'regex', 'min_size', 'max_size',
+                'older_than_days', 'newer_than_days'
+            default: category for unmatched files (default: "other")
+        """
+        if not isinstance(config, dict):
+            raise ValueError("Rules file must contain a table/object at the top level")
+        
+        extensions = config.get("extensions", {})
+        if not isinstance(extensions, dict):
+            raise ValueError("'extensions' must be a table/object of category -> extensions")
+        merged = {category: _extension_list(values, category) for category, values in extensions.items()}
+        if not config.get("replace_defaults", False):
+            for category, values in extension_map.items():
+                merged[category] = merged.get(category, []) + list(values)
+        
+        rules = config.get("rules", [])
+        if not isinstance(rules, list):
+            raise ValueError("'rules' must be a list of tables/objects")
+        return cls(merged, rules, config.get("default", "other"))
+    
+    def suffixes(self, name):
+        """Lowercased suffixes of name, longest first ("a.tar.gz" -> [".tar.gz", ".gz"])."""
+        suffixes = []
+        position = name.rfind(".")
+        while position > 0 and len(suffixes) < self.max_suffix_parts:
+            suffixes.append(name[position:])
+            position = name.rfind(".", 0, position)
+        suffixes.reverse()
+        return suffixes
+    
+    def split_extension(self, name):
+        """Split a file name into (stem, extension), keeping multi-part extensions whole.
+        
+        The extension is the last suffix, extended to the left while the
+        longer suffix or the part added is a known extension, so "a.tar.gz"
+        gives ("a", ".tar.gz") but "report.v2.pdf" gives ("report.v2", ".pdf").
+        """
+        lower = name.lower()
+        start = lower.rfind(".")
+        if start <= 0:
+            return name, ""
+        while True:
+            previous = lower.rfind(".", 0, start)
+            if previous <= 0:
+                break
+            longer, part = lower[previous:], lower[previous:start]
+            if not any(suffix in self.extensions or suffix in self.by_suffix for suffix in (longer, part)):
+                break
+            start = previous
+        return name[:start], name[start:]
+    
+    def classify(self, name, stat=None, sniff=None, sniff_all=False):
+        """Return the category of a file.
+        
+        Args:
+            name (str): The file name
+            stat (callable): Returns the file's os.stat_result; only called
+                when a candidate rule has a size or age condition
+            sniff (callable): Returns the extension detected from the file's
+                content, or None; only called when it can change the result
+            sniff_all (bool): Let the detected content override the name's
+                extension, instead of only classifying unknown extensions
+                
+        Returns:
+            str: The category name
+        """
+        lower = name.lower()
+        suffixes = self.suffixes(lower)
+        
+        if self.rules:
+            category = self._match_rules(lower, suffixes, stat)
+            if category is not None:
+                return category
+        
+        if sniff is not None and sniff_all:
+            category = self.extensions.get(sniff())
+            if category is not None:
+                return category
+        
+        for suffix in suffixes:
+            category = self.extensions.get(suffix)
+            if category is not None:
+                return category
+        
+        if sniff is not None and not sniff_all:
+            return self.extensions.get(sniff(), self.default)
+        return self.default
+    
+    def _match_rules(self, name, suffixes, stat):
+        """Category of the first rule matching the file, or None."""
+        candidates = set(self.always)
+        candidates.update(self.by_name.get(name, ()))
+        for suffix in suffixes:
+            candidates.update(self.by_suffix.get(suffix, ()))
+        for length in self.prefix_lengths:
+            candidates.update(self.by_prefix.get(name[:length], ()))
+        for length in self.tail_lengths:
+            candidates.update(self.by_tail.get(name[-length:], ()))
+        
+        pattern = self._next_pattern(name, 0)
+        if pattern is not None:
+            candidates.add(self.pattern_rules[pattern])
+        
+        while candidates:
+            index = min(candidates)
+            candidates.discard(index)
+            if self.rules[index].matches(name, suffixes, stat):
+                return self.rules[index].category
+            
+            # The pattern hit a rule whose other conditions failed; look for the next one
+            if pattern is not None and self.pattern_rules[pattern] == index:
+                pattern = self._next_pattern(name, pattern + 1, after_rule=index)
+                if pattern is not None:
+                    candidates.add(self.pattern_rules[pattern])
+        return None
+    
+    def _next_pattern(self, name, start, after_rule=-1):
+        """Position of the first pattern at or after start that matches name and belongs to a later rule."""
+        if start == 0 and self.combined_re is not None:
+            match = self.combined_re.match(name)
+            position = int(match.lastgroup[2:]) if match is not None else None
+            for separate in self.separate_patterns:
+                if position is not None and separate > position:
+                    break
+                if self.pattern_res[separate].match(name):
+                    return separate
+            return position
+        
+        for position in range(start, len(self.pattern_res)):
+            if self.pattern_rules[position] > after_rule and self.pattern_res[position].match(name):
+                return position
+        return None
+
+
+class ContentSniffer:
+    """Detects file types from their first bytes, with a persistent cache.
+    
+    Only SNIFF_BYTES are read per file, into a buffer reused by each thread,
+    and matched against all SIGNATURES at once as a single compiled regex.
+    Results are cached by (device, inode, size, mtime), which survive the
+    file being moved, so later runs do no I/O for files already sniffed.
+    """
+    
+    SIGNATURE_RE = re.compile(
+        b"|".join(b"(?P<_s%d>%s)" % (i, pattern) for i, (pattern, extension) in enumerate(SIGNATURES)),
+        re.DOTALL
+    )
+    
+    def __init__(self, cache_file=None):
+        """Initialize the sniffer.
+        
+        Args:
+            cache_file (str): JSON file the results are kept in between runs (None = no cache file)
+        """
+        self.cache_file = Path(cache_file) if cache_file else None
+        self.cache = {}
+        self.dirty = False
+        self.lookups = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._load()
+    
+    def _load(self):
+        if self.cache_file is None or not self.cache_file.exists():
+            return
+        try:
+            with open(self.cache_file, "r") as f:
+                self.cache = json.load(f).get("entries", {})
+        except (OSError, ValueError, AttributeError):
+            # A damaged cache only costs a re-sniff
+            self.cache = {}
+    
+    def save(self):
+        """Write the cache file if anything changed, keeping the most recently used entries."""
+        if self.cache_file is None or not self.dirty:
+            return
+        with self._lock:
+            entries = list(self.cache.items())[-SNIFF_CACHE_MAX_ENTRIES:]
+            self.dirty = False
+        
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = self.cache_file.with_name(self.cache_file.name + ".tmp")
+        with open(temp_file, "w") as f:
+            json.dump({"version": 1, "entries": dict(entries)}, f, separators=(",", ":"))
+        os.replace(temp_file, self.cache_file)
+    
+    def sniff(self, path, stat):
+        """Return the extension the content of a file indicates, or None.
+        
+        Args:
+            path (Path): The file
+            stat (os.stat_result): Its stat, used as the cache key
+            
+        Returns:
+            str: An extension such as ".png", or None if no signature matched
+        """
+        key = f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+        with self._lock:
+            self.lookups += 1
+            if key in self.cache:
+                self.hits += 1
+                # Re-insert so the entry counts as recently used when the cache is trimmed
+                extension = self.cache[key] = self.cache.pop(key)
+                return extension or None
+        
+        try:
+            extension = self._read_signature(path)
+        except OSError:
+            # Unreadable now; classify by name and try again next time
+            return None
+        with self._lock:
+            self.cache[key] = extension or ""
+            self.dirty = True
+        return extension
+    
+    def _read_signature(self, path):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = bytearray(SNIFF_BYTES)
+        
+        with open(path, "rb", buffering=0) as f:
+            length = f.readinto(buffer)
+        
+        match = self.SIGNATURE_RE.match(memoryview(buffer)[:length])
+        if match is None:
+            return None
+        return SIGNATURES[int(match.lastgroup[2:])][1]
+
+
+class InotifyWatcher:
+    """Directory events from Linux inotify, called through ctypes.
+    
+    Reports files that were closed after writing or moved in, and new
+    subdirectories. Waiting for events blocks in select, so an idle watcher
+    uses no CPU.
+    """
+    
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    
+    EVENT = struct.Struct("iIII")
+    
+    def __init__(self):
+        """Open an inotify instance; raises OSError where inotify is not available."""
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available on this system")
+        self._libc = libc
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        self.overflowed = False
+    
+    def add(self, directory):
+        """Start watching a directory (not its subdirectories)."""
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE | self.IN_ONLYDIR
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(directory))
+        self.directories[wd] = Path(directory)
+    
+    def watched(self):
+        return list(self.directories.values())
+    
+    def read(self, timeout):
+        """Wait up to timeout seconds (None = forever) for events.
+        
+        Returns:
+            list: (directory, name, is_dir) per event
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            
+            if mask & self.IN_Q_OVERFLOW:
+                # Events were dropped; the caller rescans the watched directories
+                self.overflowed = True
+            elif mask & self.IN_IGNORED:
+                # The directory was removed or moved away
+                self.directories.pop(wd, None)
+            elif wd in self.directories and name:
+                events.append((self.directories[wd], name, bool(mask & self.IN_ISDIR)))
+        return events
+    
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Fallback for InotifyWatcher that rescans the watched directories periodically.
+    
+    Reports new and changed entries by comparing each scan with the
+    previous one.
+    """
+    
+    def __init__(self, interval=WATCH_POLL_SECONDS):
+        self.interval = interval
+        self.directories = {}
+        self.overflowed = False
+        self._next_scan = time.monotonic() + interval
+    
+    def add(self, directory):
+        """Start watching a directory; files already in it are not reported."""
+        self.directories[Path(directory)] = self._scan(Path(directory))
+    
+    def watched(self):
+        return list(self.directories)
+    
+    def _scan(self, directory):
+        snapshot = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                snapshot[entry.name] = (st.st_size, st.st_mtime_ns, entry.is_dir())
+        return snapshot
+    
+    def read(self, timeout):
+        """Sleep until the next scan, or for timeout seconds if that is sooner.
+        
+        Returns:
+            list: (directory, name, is_dir) per new or changed entry
+        """
+        wait = max(0.0, self._next_scan - time.monotonic())
+        if timeout is not None and timeout < wait:
+            time.sleep(timeout)
+            return []
+        time.sleep(wait)
+        self._next_scan = time.monotonic() + self.interval
+        
+        events = []
+        for directory, previous in list(self.directories.items()):
+            try:
+                current = self._scan(directory)
+            except OSError:
+                del self.directories[directory]
+                continue
+            for name, signature in current.items():
+                if previous.get(name) != signature:
+                    events.append((directory, name, signature[2]))
+            self.directories[directory] = current
+        return events
+    
+    def close(self):
+        pass
+
+
+def _partial_hash(path, size):
+    """Hash of the first and last DEDUPE_BLOCK_SIZE bytes (all of a small file), or None if unreadable."""
+    try:
+        with open(path, "rb") as f:
+            digest = hashlib.blake2b(f.read(DEDUPE_BLOCK_SIZE))
+            if size > DEDUPE_BLOCK_SIZE:
+                f.seek(max(DEDUPE_BLOCK_SIZE, size - DEDUPE_BLOCK_SIZE))
+                digest.update(f.read(DEDUPE_BLOCK_SIZE))
+        return digest.digest()
+    except OSError:
+        return None
+
+
+def _full_hash(path):
+    """Hash of a whole file, or None if unreadable; runs in a worker process."""
+    digest = hashlib.blake2b()
+    try:
+        with open(path, "rb", buffering=0) as f:
+            buffer = bytearray(HASH_CHUNK_SIZE)
+            view = memoryview(buffer)
+            while True:
+                length = f.readinto(buffer)
+                if not length:
+                    break
+                digest.update(view[:length])
+        return digest.digest()
+    except OSError:
+        return None
+
+
+class DuplicateFinder:
+    """Finds files with identical content, reading as little as possible.
+    
+    Files are compared in stages and drop out as soon as they are unique:
+    by size (from stat, no reads), by a hash of the first and last block
+    (threads), and only then by a hash of the whole file (a process pool).
+    Files no larger than two blocks are settled by the partial hash. Hard
+    links to one inode take no extra space, so they are not duplicates of
+    each other; each inode is compared once, through its first path.
+    """
+    
+    def __init__(self, processes=None, readers=DEDUPE_READERS):
+        """Initialize the finder.
+        
+        Args:
+            processes (int): Processes hashing whole files (default: one per CPU)
+            readers (int): Threads reading the first/last blocks
+        """
+        self.processes = processes
+        self.readers = readers
+        self.bytes_read = 0
+    
+    def find(self, files):
+        """Group files with identical content.
+        
+        Args:
+            files (list): (path, os.stat_result) pairs; empty files are ignored
+            
+        Returns:
+            list: Groups (lists of paths, in input order) of two or more
+                identical files on distinct inodes, one path per inode
+        """
+        order = {path: index for index, (path, st) in enumerate(files)}
+        
+        # Stage 1: size, with one path standing for all hard links to an inode
+        by_size = {}
+        for path, st in files:
+            if st.st_size > 0:
+                by_size.setdefault(st.st_size, {}).setdefault((st.st_dev, st.st_ino), path)
+        
+        groups = []
+        candidates = []
+        for size, inodes in by_size.items():
+            if len(inodes) > 1:
+                candidates.extend((size, path) for path in inodes.values())
+        
+        # Stage 2: first and last block
+        with ThreadPoolExecutor(max_workers=self.readers) as executor:
+            partial = list(executor.map(lambda candidate: _partial_hash(candidate[1], candidate[0]), candidates))
+        self.bytes_read += sum(min(size, 2 * DEDUPE_BLOCK_SIZE) for size, path in candidates)
+        
+        by_partial = {}
+        for (size, path), digest in zip(candidates, partial):
+            if digest is not None:
+                by_partial.setdefault((size, digest), []).append(path)
+        
+        # Stage 3: whole files, only for larger files that still collide
+        full_candidates = []
+        for (size, digest), members in by_partial.items():
+            if len(members) < 2:
+                continue
+            if size <= 2 * DEDUPE_BLOCK_SIZE:
+                groups.append(members)
+            else:
+                full_candidates.extend((size, path) for path in members)
+        
+        if full_candidates:
+            with ProcessPoolExecutor(max_workers=self.processes) as executor:
+                full = list(executor.map(_full_hash, [path for size, path in full_candidates], chunksize=8))
+            self.bytes_read += sum(size for size, path in full_candidates)
+            
+            by_full = {}
+            for (size, path), digest in zip(full_candidates, full):
+                if digest is not None:
+                    by_full.setdefault((size, digest), []).append(path)
+            groups.extend(members for members in by_full.values() if len(members) > 1)
+        
+        return [sorted(group, key=order.get) for group in groups]
+
+
+class MoveJournal:
+    """Append-only record of moves, used to resume and undo runs.
+    
+    One JSON array per line, with paths relative to the organized directory:
+        ["R", started, root]         a run starts
+        ["B", batch, [[src, dst], ...]]  moves about to be executed, written
+                                         and synced before the batch runs
+        ["D", src, dst]              src went to dst instead, as its planned
+                                     name was taken meanwhile; synced right
+                                     after that move
+        ["C", batch, moved]          checkpoint: the batch finished
+        ["E", moved]                 the run finished
+    A batch without its checkpoint was interrupted; any of its moves may
+    have happened, so undo checks each on disk, and resuming checks them to
+    write the batch's checkpoint.
+    """
+    
+    def __init__(self, path, root):
+        self.path = Path(path)
+        self.root = Path(root)
+        self.file = None
+        self.batch = 0
+        self.moved = 0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def read_runs(path):
+        """Parse a journal file.
+        
+        Returns:
+            list: One dict per run with 'offset' (of its R line), 'batches',
+                'checkpoints', 'moved' and 'finished'
+        """
+        runs = []
+        offset = 0
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn last line of an interrupted run
+                    break
+                if record[0] == "R":
+                    runs.append({"offset": offset, "batches": [], "checkpoints": 0, "moved": 0, "finished": False})
+                elif runs and record[0] == "B":
+                    runs[-1]["batches"].append(record[2])
+                elif runs and record[0] == "D" and runs[-1]["batches"]:
+                    runs[-1]["batches"][-1] = [
+                        [source, record[2] if source == record[1] else dest] for source, dest in runs[-1]["batches"][-1]
+                    ]
+                elif runs and record[0] == "C":
+                    runs[-1]["checkpoints"] = record[1]
+                    runs[-1]["moved"] += record[2]
+                elif runs and record[0] == "E":
+                    runs[-1]["finished"] = True
+                offset += len(line)
+        return runs
+    
+    def open(self, resume=False):
+        """Start a new run, or continue the journal's last run when resume is true.
+        
+        Returns:
+            dict: The resumed run (see read_runs), or None for a new run
+        """
+        runs = self.read_runs(self.path) if self.path.exists() else []
+        last = runs[-1] if runs else None
+        
+        self.file = open(self.path, "ab")
+        if resume and last is not None and not last["finished"]:
+            self.batch = len(last["batches"])
+            if last["checkpoints"] < self.batch:
+                # Count the moves of the interrupted batch that happened
+                moved = sum(1 for source, dest in last["batches"][-1]
+                            if not (self.root / source).exists() and (self.root / dest).exists())
+                self._write(["C", self.batch, moved])
+                last["checkpoints"] = self.batch
+                last["moved"] += moved
+            self.moved = last["moved"]
+            return last
+        self._write(["R", datetime.now().isoformat(timespec="seconds"), str(self.root)])
+        return None
+    
+    def _write(self, record):
+        # Moves run on worker threads, which record their renames themselves
+        with self.lock:
+            self.file.write(json.dumps(record, separators=(",", ":")).encode() + b"\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+    
+    def begin_batch(self, moves):
+        """Record (source, destination) paths before they are moved."""
+        self.batch += 1
+        self._write(["B", self.batch, [[self._relative(source), self._relative(dest)] for source, dest in moves]])
+    
+    def renamed(self, source, dest):
+        """Record that a file of the current batch ended up at another destination than planned."""
+        self._write(["D", self._relative(source), self._relative(dest)])
+    
+    def checkpoint(self, moved):
+        """Record that the current batch finished, with moved of its files moved."""
+        self.moved += moved
+        self._write(["C", self.batch, moved])
+    
+    def close(self, finished):
+        if finished:
+            self._write(["E", self.moved])
+        self.file.close()
+    
+    def _relative(self, path):
+        return os.path.relpath(path, self.root)
+
+
+_rename_noreplace = None
+
+
+def _load_rename_noreplace():
+    """The platform's rename-unless-exists call, as f(source, dest) -> errno (0 on success), or None."""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except (OSError, TypeError):
+        return None
+    
+    if hasattr(libc, "renameat2"):
+        # Linux 3.15+ / glibc 2.28+
+        at_fdcwd, rename_noreplace = -100, 1
+        
+        def rename(source, dest):
+            if libc.renameat2(at_fdcwd, source, at_fdcwd, dest, rename_noreplace) == 0:
+                return 0
+            return ctypes.get_errno()
+        return rename
+    
+    if sys.platform == "darwin" and hasattr(libc, "renamex_np"):
+        rename_excl = 0x4
+        
+        def rename(source, dest):
+            if libc.renamex_np(source, dest, rename_excl) == 0:
+                return 0
+            return ctypes.get_errno()
+        return rename
+    return None
+
+
+def move_noreplace(source, dest):
+    """Rename source to dest atomically, raising FileExistsError instead of replacing dest.
+    
+    Uses renameat2(RENAME_NOREPLACE) (renamex_np on macOS), else os.link +
+    unlink, which is atomic on any filesystem with hard links (including
+    NFS). Raises OSError with errno EXDEV when dest is on another filesystem.
+    """
+    global _rename_noreplace
+    if _rename_noreplace is None:
+        _rename_noreplace = _load_rename_noreplace() or False
+    
+    if _rename_noreplace:
+        error = _rename_noreplace(os.fsencode(source), os.fsencode(dest))
+        if error == 0:
+            return
+        if error == errno.EEXIST:
+            raise FileExistsError(error, os.strerror(error), str(dest))
+        if error not in (errno.EINVAL, errno.ENOSYS, errno.ENOTSUP):
+            raise OSError(error, os.strerror(error), str(source))
+        # The filesystem doesn't support the flag; fall through
+    
+    try:
+        os.link(source, dest, follow_symlinks=False)
+    except FileExistsError:
+        raise
+    except OSError as e:
+        if e.errno == errno.EXDEV:
+            raise
+        # No hard links here (e.g. FAT, SMB): best effort, not atomic
+        if os.path.lexists(dest):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), str(dest))
+        os.rename(source, dest)
+        return
+    os.unlink(source)
+
+
+def _format_bytes(count):
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if count < 1024 or unit == "TB":
+            return f"{count:.1f} {unit}" if unit != "B" else f"{count} B"
+        count /= 1024
+
+
+def _format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class TransferMeter:
+    """Throughput of cross-device copies, shared by all worker threads.
+    
+    Logs the transfer rate and the time left for the copies in progress
+    every PROGRESS_INTERVAL seconds, and keeps totals for the run summary.
+    """
+    
+    def __init__(self, logger, interval=PROGRESS_INTERVAL):
+        self.logger = logger
+        self.interval = interval
+        self.files = 0
+        self.bytes = 0
+        self.remaining = 0
+        self.active = 0.0
+        self._started = None
+        self._next_report = None
+        self._lock = threading.Lock()
+    
+    def start(self, size):
+        """A copy of size bytes begins."""
+        with self._lock:
+            if self._started is None:
+                self._started = time.monotonic()
+                self._next_report = self._started + self.interval
+            self.files += 1
+            self.remaining += size
+    
+    def advance(self, count):
+        """count more bytes were copied."""
+        with self._lock:
+            self.bytes += count
+            self.remaining -= count
+            now = time.monotonic()
+            if now < self._next_report:
+                return
+            self._next_report = now + self.interval
+            rate = self.rate(now)
+            remaining = self.remaining
+        eta = _format_duration(remaining / rate) if rate else "unknown"
+        self.logger.info(f"Copying across filesystems: {_format_bytes(remaining)} left, "
+                         f"{_format_bytes(rate)}/s, ETA {eta}")
+    
+    def finish(self, uncopied):
+        """A copy ended, with uncopied of its bytes not copied (0 unless it failed)."""
+        with self._lock:
+            self.remaining -= uncopied
+            if self.remaining == 0 and self._started is not None:
+                # Only time spent copying counts towards the rate
+                self.active += time.monotonic() - self._started
+                self._started = None
+    
+    def rate(self, now=None):
+        """Bytes per second over the time copies were running."""
+        active = self.active
+        if self._started is not None:
+            active += (now or time.monotonic()) - self._started
+        return self.bytes / active if active > 0 else 0.0
+
+
+def _copy_data(src_fd, dst_fd, size, meter=None):
+    """Copy size bytes between file descriptors with the cheapest method that works.
+    
+    Tries a reflink (FICLONE: shares blocks, nothing copied; works between
+    mounts of one btrfs/XFS filesystem), then copy_file_range (copies in
+    the kernel, server-side on NFS 4.2/SMB), then sendfile, then plain
+    reads and writes.
+    
+    Returns:
+        int: Bytes copied
+    """
+    if fcntl is not None and size:
+        try:
+            fcntl.ioctl(dst_fd, FICLONE, src_fd)
+            if meter is not None:
+                meter.advance(size)
+            return size
+        except OSError:
+            pass
+    
+    methods = [name for name in ("copy_file_range", "sendfile") if hasattr(os, name)] + ["read"]
+    method = methods.pop(0)
+    copied = 0
+    while copied < size:
+        count = min(COPY_CHUNK_SIZE, size - copied)
+        try:
+            if method == "copy_file_range":
+                written = os.copy_file_range(src_fd, dst_fd, count, copied, copied)
+            elif method == "sendfile":
+                written = os.sendfile(dst_fd, src_fd, copied, count)
+            else:
+                data = os.pread(src_fd, count, copied)
+                written = 0
+                while written < len(data):
+                    written += os.write(dst_fd, data[written:])
+        except OSError as e:
+            if method != "read" and e.errno in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EBADF):
+                # Not supported between these filesystems; next method from the same offset
+                method = methods.pop(0)
+                os.lseek(dst_fd, copied, os.SEEK_SET)
+                continue
+            raise
+        
+        if written == 0:
+            # The source got shorter; the size check catches it
+            break
+        copied += written
+        if method == "copy_file_range":
+            # Explicit offsets don't move the file position; keep it in step for a fallback
+            os.lseek(dst_fd, copied, os.SEEK_SET)
+        if meter is not None:
+            meter.advance(written)
+    return copied
+
+
+def move_across_devices(source, dest, meter=None):
+    """Move a file to another filesystem: copy it to a new dest, verify, then delete source.
+    
+    dest is created exclusively, so an existing file raises FileExistsError
+    and is never overwritten. The copy is synced to disk and its size
+    checked, and the source must not have changed during the copy, before
+    the source is deleted. On failure the partial copy is removed.
+    
+    Args:
+        source (Path): The file to move
+        dest (Path): Its new path, on another filesystem
+        meter (TransferMeter): Optional progress and throughput reporting
+        
+    Returns:
+        int: Bytes copied
+    """
+    if os.path.islink(source):
+        # A symlink is recreated, not followed
+        os.symlink(os.readlink(source), dest)
+        os.unlink(source)
+        return 0
+    
+    with open(source, "rb", buffering=0) as src:
+        before = os.fstat(src.fileno())
+        fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_EXCL, before.st_mode & 0o7777)
+        try:
+            with open(fd, "wb", buffering=0) as dst:
+                copied = 0
+                if meter is not None:
+                    meter.start(before.st_size)
+                try:
+                    copied = _copy_data(src.fileno(), dst.fileno(), before.st_size, meter)
+                finally:
+                    if meter is not None:
+                        meter.finish(before.st_size - copied)
+                os.fsync(dst.fileno())
+                
+                after = os.fstat(src.fileno())
+                if os.fstat(dst.fileno()).st_size != before.st_size:
+                    raise OSError(errno.EIO, "copy has the wrong size", str(dest))
+                if (after.st_size, after.st_mtime_ns) != (before.st_size, before.st_mtime_ns):
+                    raise OSError(errno.EAGAIN, "file changed while it was copied", str(source))
+            shutil.copystat(source, dest)
+        except BaseException:
+            try:
+                os.unlink(dest)
+            except OSError:
+                pass
+            raise
+    
+    os.unlink(source)
+    return before.st_size
+
+
+class DestinationIndex:
+    """Names in each destination folder, listed once and kept in memory.
+    
+    Free names are handed out from the in-memory sets ("name.ext", then
+    "name_1.ext", "name_2.ext", ...), so choosing a destination costs no
+    syscalls after a folder's first file. Safe to use from worker threads.
+    """
+    
+    def __init__(self, split_extension=None):
+        """Initialize the index.
+        
+        Args:
+            split_extension (callable): Splits a name into (stem, extension), so
+                counters go before all of a multi-part extension (default: last suffix only)
+        """
+        self.split_extension = split_extension or (lambda name: (Path(name).stem, Path(name).suffix))
+        self._names = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+    
+    def _listing(self, folder):
+        names = self._names.get(folder)
+        if names is None:
+            try:
+                with os.scandir(folder) as entries:
+                    names = {entry.name for entry in entries}
+            except FileNotFoundError:
+                names = set()
+            self._names[folder] = names
+        return names
+    
+    def reserve(self, folder, name):
+        """Claim a free name in folder: name itself, or name with a counter before its extension.
+        
+        Args:
+            folder (Path): The destination folder (need not exist yet)
+            name (str): The preferred file name
+            
+        Returns:
+            str: The name claimed
+        """
+        with self._lock:
+            names = self._listing(folder)
+            if name not in names:
+                names.add(name)
+                return name
+            
+            # Remember the last counter per base name, so many copies don't rescan from 1
+            stem, extension = self.split_extension(name)
+            key = (folder, stem, extension)
+            counter = self._counters.get(key, 0)
+            while True:
+                counter += 1
+                candidate = f"{stem}_{counter}{extension}"
+                if candidate not in names:
+                    break
+            self._counters[key] = counter
+            names.add(candidate)
+            return candidate
+    
+    def forget(self, folder):
+        """Drop what is known about folder, so it is listed again on next use."""
+        with self._lock:
+            self._names.pop(folder, None)
+            for key in [key for key in self._counters if key[0] == folder]:
+                del self._counters[key]
+
+
 class FileOrganizer:
     """Class to organize files based on their extensions."""
     
@@ -47,7 +1321,8 @@ class FileOrganizer:
         "code": [".py", ".js", ".html", ".css", ".java", ".cpp", ".c", ".h", ".php", ".rb", ".json", ".xml"],
     }
     
-    def __init__(self, directory, logger, create_other_folder=True, recursive=False):
+    def __init__(self, directory, logger, create_other_folder=True, recursive=False, workers=1, rules=None,
+                 sniffer=None, sniff_all=False, dedupe=None):
         """Initialize the FileOrganizer class.
         
         Args:
@@ -55,17 +1330,45 @@ class FileOrganizer:
             logger (Logger): Logger instance
             create_other_folder (bool): Whether to create an 'other' folder for unmatched files
             recursive (bool): Whether to process subdirectories recursively
+            workers (int): Number of files moved concurrently (1 = one at a time)
+            rules (ClassificationRules): Compiled classification rules (default: EXTENSION_MAP)
+            sniffer (ContentSniffer): Detects the type of files from their content (None = names only)
+            sniff_all (bool): Sniff every file and trust the content over the extension,
+                instead of sniffing only files with a missing or unknown extension
+            dedupe (str): What to do with files whose content is already in their
+                destination folder or elsewhere in the plan: 'skip' (leave them
+                in place), 'hardlink' (move them as a hard link to the kept copy),
+                'report' (only log them), or None to not look for duplicates
         """
         self.directory = Path(directory)
         self.logger = logger
         self.create_other_folder = create_other_folder
         self.recursive = recursive
+        self.workers = max(1, workers)
+        self.rules = rules if rules is not None else ClassificationRules(self.EXTENSION_MAP)
+        self.sniffer = sniffer
+        self.sniff_all = sniff_all
+        self.dedupe = dedupe
+        
+        # Folders the organizer creates, never descended into
+        self.category_names = frozenset(self.rules.categories)
         self.stats = {
             "total_files": 0,
             "moved_files": 0,
             "skipped_files": 0,
+            "duplicates": 0,
             "errors": 0
         }
+        
+        # Worker threads update stats and create category folders concurrently
+        self._stats_lock = threading.Lock()
+        self._dirs_lock = threading.Lock()
+        self._created_dirs = set()
+        self.destinations = DestinationIndex(self.rules.split_extension)
+        self._renamed = {}
+        self.transfers = TransferMeter(logger)
+        self._executor = None
+        self._pending = None
     
     def get_category_for_extension(self, extension):
         """Determine the category for a given file extension.
@@ -76,99 +1379,626 @@ class FileOrganizer:
         Returns:
             str: The category name, or 'other' if not found
         """
-        extension = extension.lower()
+        return self.rules.extensions.get(extension.lower(), self.rules.default)
+    
+    def organize(self, dry_run=False, journal_file=None, resume=False):
+        """Organize the files in the directory.
         
-        for category, extensions in self.EXTENSION_MAP.items():
-            if extension in extensions:
-                return category
+        Works in two phases: plan() decides where each file goes, and
+        execute() carries the plan out in batches, recording every batch in
+        a journal so the run can be resumed or undone.
         
-        return "other"
-    
-    def organize(self):
-        """Organize the files in the directory."""
+        Args:
+            dry_run (bool): Only log the planned moves
+            journal_file (str): Journal path (default: JOURNAL_NAME in the directory)
+            resume (bool): Continue the journal's last run if it was interrupted
+        """
         if not self.directory.exists():
             self.logger.error(f"Directory does not exist: {self.directory}")
             return
         
-        self.logger.info(f"Starting file organization in: {self.directory}")
         start_time = time.time()
         
-        if self.recursive:
-            self._organize_recursive(self.directory)
-        else:
-            self._organize_directory(self.directory)
+        moves = self.plan()
+        links = []
+        if self.dedupe:
+            # Duplicates can be anywhere in the plan, so it is collected in full first
+            moves, links = self._find_duplicates(list(moves), dry_run)
+        
+        if dry_run:
+            self.logger.info(f"Planning file organization in: {self.directory} (dry run)")
+            planned = 0
+            for source, dest, category in moves:
+                planned += 1
+                self.logger.info(f"Would move: {source.relative_to(self.directory)} -> {dest.relative_to(self.directory)}")
+            self.logger.info(f"Dry run completed in {time.time() - start_time:.2f} seconds: {planned} files would be moved")
+            # Nothing was moved, but the types sniffed while planning are kept for the real run
+            self._stop_workers()
+            self._log_stats()
+            return
+        
+        self.logger.info(f"Starting file organization in: {self.directory}")
+        journal = MoveJournal(journal_file or self.directory / JOURNAL_NAME, self.directory)
+        try:
+            resumed = journal.open(resume)
+        except OSError as e:
+            self.logger.error(f"Cannot open journal {journal.path}: {str(e)}")
+            return
+        if resumed is not None:
+            self.logger.info(f"Resuming interrupted run after batch {resumed['checkpoints']} ({resumed['moved']} files moved)")
+        
+        finished = False
+        self._start_workers()
+        try:
+            self.execute(moves, journal)
+            self._link_duplicates(links)
+            finished = True
+        finally:
+            self._stop_workers()
+            journal.close(finished)
         
         duration = time.time() - start_time
         self.logger.info(f"File organization completed in {duration:.2f} seconds")
-        self.logger.info(f"Total files: {self.stats['total_files']}")
-        self.logger.info(f"Moved files: {self.stats['moved_files']}")
-        self.logger.info(f"Skipped files: {self.stats['skipped_files']}")
-        self.logger.info(f"Errors: {self.stats['errors']}")
+        self._log_stats()
     
-    def _organize_recursive(self, directory):
-        """Recursively organize files in the directory and its subdirectories.
+    def plan(self, on_directory=None):
+        """Stream the move plan: where each file of the directory tree should go.
         
         Args:
-            directory (Path): The directory to organize
+            on_directory (callable): Called with each directory before it is read
+            
+        Yields:
+            tuple: (source Path, destination Path, category)
         """
-        self._organize_directory(directory)
-        
-        # Process subdirectories
-        for item in directory.iterdir():
-            if item.is_dir():
-                # Skip the category folders we're creating
-                if item.name not in list(self.EXTENSION_MAP.keys()) + ["other"]:
-                    self._organize_recursive(item)
+        for directory, name, stat in self._scan_tree(self.directory, on_directory):
+            move = self._plan_file(directory, name, stat)
+            if move is not None:
+                yield move
     
-    def _organize_directory(self, directory):
-        """Organize files in a specific directory.
+    def _find_duplicates(self, moves, dry_run=False):
+        """Apply the dedupe mode to a complete plan.
+        
+        Planned files are compared with each other and with the files
+        already in their destination folders. In each group of identical
+        files the copy already organized (else the first planned one) is
+        kept.
         
         Args:
-            directory (Path): The directory to organize
+            moves (list): (source, destination, category) tuples from plan()
+            dry_run (bool): Only log what would happen
+            
+        Returns:
+            tuple: (moves to execute, [(destination, kept file)] to hard link after moving)
         """
-        self.logger.info(f"Processing directory: {directory}")
+        start_time = time.time()
+        planned = {}
+        files = []
+        folders = set()
+        for move in moves:
+            source, dest, category = move
+            try:
+                files.append((source, source.stat()))
+                planned[source] = move
+            except OSError:
+                pass
+            folders.add(dest.parent)
         
-        for item in directory.iterdir():
-            # Skip directories and hidden files
-            if item.is_dir() or item.name.startswith('.'):
-                continue
-                
-            self.stats["total_files"] += 1
-            
+        # Files already organized, listed once per destination folder
+        for folder in folders:
             try:
-                # Get the file extension and category
-                extension = item.suffix
-                category = self.get_category_for_extension(extension)
-                
-                # Skip if category is 'other' and we don't want to create that folder
-                if category == "other" and not self.create_other_folder:
-                    self.logger.info(f"Skipping unknown type file: {item.name}")
-                    self.stats["skipped_files"] += 1
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if entry.is_file(follow_symlinks=False):
+                            files.append((folder / entry.name, entry.stat()))
+            except OSError:
+                pass
+        
+        finder = DuplicateFinder()
+        groups = finder.find(files)
+        
+        verb = {"skip": "skip", "hardlink": "hard link", "report": "keep"}[self.dedupe]
+        dropped = set()
+        links = []
+        for group in groups:
+            # Prefer keeping a copy that is already organized
+            group.sort(key=lambda path: path in planned)
+            kept = group[0]
+            kept_path = planned[kept][1] if kept in planned else kept
+            for path in group[1:]:
+                if path not in planned:
+                    continue
+                self._increment_stat("duplicates")
+                self.logger.info(f"Duplicate of {kept_path.relative_to(self.directory)}: {path.relative_to(self.directory)}"
+                                 + (f" (would {verb})" if dry_run else f" ({verb})"))
+                if self.dedupe == "skip":
+                    dropped.add(path)
+                    self._increment_stat("skipped_files")
+                elif self.dedupe == "hardlink":
+                    links.append((planned[path][1], kept_path))
+        
+        self.logger.info(f"Dedupe: {self.stats['duplicates']} duplicates in {len(groups)} groups, "
+                         f"{finder.bytes_read / 1e6:.1f} MB hashed in {time.time() - start_time:.2f} seconds")
+        return [move for move in moves if move[0] not in dropped], links
+    
+    def _link_duplicates(self, links):
+        """Replace moved duplicates with hard links to the kept copies."""
+        for dest, kept in links:
+            dest = self._renamed.get(dest, dest)
+            kept = self._renamed.get(kept, kept)
+            temp = dest.with_name(f".{dest.name}.link")
+            try:
+                if not dest.exists() or os.path.samefile(dest, kept):
                     continue
+                os.link(kept, temp)
+                os.replace(temp, dest)
+            except OSError as e:
+                self.logger.error(f"Error hard linking {dest.name} to {kept}: {str(e)}")
+                self._increment_stat("errors")
+                try:
+                    temp.unlink()
+                except OSError:
+                    pass
+    
+    def execute(self, moves, journal=None, batch_size=MOVE_BATCH_SIZE):
+        """Carry out planned moves in batches.
+        
+        Each batch is written to the journal before it runs and checkpointed
+        once all of its moves have finished.
+        
+        Args:
+            moves (iterable): (source, destination, category) tuples, e.g. from plan()
+            journal (MoveJournal): Where batches are recorded (None = not recorded)
+            batch_size (int): Moves per batch
+        """
+        batch = []
+        for move in moves:
+            batch.append(move)
+            if len(batch) >= batch_size:
+                self._execute_batch(batch, journal)
+                batch = []
+        if batch:
+            self._execute_batch(batch, journal)
+    
+    def _execute_batch(self, batch, journal):
+        if journal is not None:
+            journal.begin_batch([(source, dest) for source, dest, category in batch])
+        futures = [self._submit(self._move_journaled, source, dest, category, journal) for source, dest, category in batch]
+        wait(futures)
+        for (source, dest, category), future in zip(batch, futures):
+            if future.result() not in (None, dest):
+                # The planned name was taken meanwhile; later stages need the real one
+                self._renamed[dest] = future.result()
+        if journal is not None:
+            journal.checkpoint(sum(1 for future in futures if future.result() is not None))
+    
+    def undo(self, journal_file=None):
+        """Move the files of the last journaled run back, newest move first.
+        
+        Each move is checked on disk, so interrupted batches undo safely.
+        The run is then removed from the journal; undoing again undoes the
+        run before it. Files are never overwritten.
+        
+        Args:
+            journal_file (str): Journal path (default: JOURNAL_NAME in the directory)
+        """
+        path = Path(journal_file or self.directory / JOURNAL_NAME)
+        try:
+            runs = MoveJournal.read_runs(path)
+        except OSError as e:
+            self.logger.error(f"Cannot read journal {path}: {str(e)}")
+            return
+        if not runs:
+            self.logger.error(f"Nothing to undo in journal {path}")
+            return
+        
+        run = runs[-1]
+        self.logger.info(f"Undoing last run in: {self.directory}")
+        start_time = time.time()
+        
+        restored = 0
+        folders = set()
+        for batch in reversed(run["batches"]):
+            for source, dest in reversed(batch):
+                source = self.directory / source
+                dest = self.directory / dest
+                self._increment_stat("total_files")
+                try:
+                    if source.exists() or not dest.exists():
+                        # Never moved (failed, or after an interruption), or changed since
+                        self._increment_stat("skipped_files")
+                        continue
+                    try:
+                        move_noreplace(dest, source)
+                    except OSError as e:
+                        if e.errno != errno.EXDEV:
+                            raise
+                        move_across_devices(dest, source, self.transfers)
+                    restored += 1
+                    folders.add(dest.parent)
+                except OSError as e:
+                    self.logger.error(f"Error restoring {source}: {str(e)}")
+                    self._increment_stat("errors")
+        self.stats["moved_files"] = restored
+        
+        # Remove category folders the run left empty
+        for folder in sorted(folders, key=lambda folder: len(folder.parts), reverse=True):
+            try:
+                folder.rmdir()
+            except OSError:
+                pass
+        
+        with open(path, "r+b") as f:
+            f.truncate(run["offset"])
+        if run["offset"] == 0:
+            path.unlink()
+        
+        self.logger.info(f"Undo completed in {time.time() - start_time:.2f} seconds")
+        self._log_stats()
+    
+    def watch(self, settle=WATCH_SETTLE_SECONDS, report_interval=WATCH_REPORT_SECONDS, poll_interval=None):
+        """Organize the directory, then keep organizing new files as they arrive.
+        
+        Uses inotify where available and falls back to polling. A new file
+        is moved once it has been left unchanged for `settle` seconds, so
+        files still being written or copied are not moved half-way. Runs
+        until interrupted (Ctrl+C or SIGTERM).
+        
+        Args:
+            settle (float): Seconds a file must stay unchanged before it is moved
+            report_interval (float): Seconds between statistics reports (0 = only at exit)
+            poll_interval (float): Force polling with this interval instead of inotify
+        """
+        if not self.directory.exists():
+            self.logger.error(f"Directory does not exist: {self.directory}")
+            return
+        
+        watcher = None
+        if poll_interval is None:
+            try:
+                watcher = InotifyWatcher()
+            except (OSError, AttributeError, TypeError) as e:
+                self.logger.warning(f"inotify unavailable ({str(e)}), polling every {WATCH_POLL_SECONDS:g} seconds")
+        if watcher is None:
+            watcher = PollingWatcher(poll_interval or WATCH_POLL_SECONDS)
+        
+        self.logger.info(f"Watching for new files in: {self.directory}")
+        start_time = time.time()
+        
+        # Path -> [deadline, (size, mtime) at the last check] of files waiting to settle
+        pending = {}
+        next_report = time.monotonic() + report_interval if report_interval else None
+        
+        self._start_workers()
+        try:
+            # Watches go in before each directory is scanned, so nothing arriving meanwhile is missed
+            self.execute(self.plan(on_directory=lambda directory: self._add_watch(watcher, directory)))
+            
+            while True:
+                deadlines = [entry[0] for entry in pending.values()]
+                if next_report is not None:
+                    deadlines.append(next_report)
+                timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
                 
-                # Create the category directory if it doesn't exist
-                category_dir = directory / category
-                category_dir.mkdir(exist_ok=True)
+                events = watcher.read(timeout)
+                now = time.monotonic()
                 
-                # Create the destination path
-                dest_path = category_dir / item.name
+                if watcher.overflowed:
+                    watcher.overflowed = False
+                    self.logger.warning("Event queue overflowed, rescanning watched directories")
+                    for directory in watcher.watched():
+                        self._queue_tree(watcher, directory, pending, now + settle)
                 
-                # Handle file name conflicts
-                if dest_path.exists():
-                    base_name = item.stem
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    new_name = f"{base_name}_{timestamp}{extension}"
-                    dest_path = category_dir / new_name
-                    self.logger.warning(f"File already exists, renaming to: {new_name}")
+                for directory, name, is_dir in events:
+                    if not is_dir:
+                        self._queue_file(directory / name, pending, now + settle)
+                    elif self.recursive and name not in self.category_names and not name.startswith('.'):
+                        self._queue_tree(watcher, directory / name, pending, now + settle)
                 
-                # Move the file
-                shutil.move(str(item), str(dest_path))
-                self.logger.info(f"Moved: {item.name} -> {category}/{dest_path.name}")
-                self.stats["moved_files"] += 1
+                for path in [path for path, entry in pending.items() if entry[0] <= now]:
+                    self._check_settled(path, pending, now, settle)
                 
-            except Exception as e:
-                self.logger.error(f"Error processing {item.name}: {str(e)}")
-                self.stats["errors"] += 1
+                if next_report is not None and now >= next_report:
+                    next_report = now + report_interval
+                    self.logger.info(f"Watching for {time.time() - start_time:.0f} seconds")
+                    self._log_stats()
+        except KeyboardInterrupt:
+            self.logger.info("Stopping watch")
+        finally:
+            watcher.close()
+            self._stop_workers()
+        
+        self.logger.info(f"Watched for {time.time() - start_time:.0f} seconds")
+        self._log_stats()
+    
+    def _add_watch(self, watcher, directory):
+        try:
+            watcher.add(directory)
+        except OSError as e:
+            self.logger.error(f"Cannot watch {directory}: {str(e)}")
+            self._increment_stat("errors")
+    
+    def _queue_file(self, path, pending, deadline):
+        """Schedule a new or changed file to be checked once it may have settled."""
+        name = path.name
+        if name.startswith('.') or name.lower().endswith(PARTIAL_SUFFIXES):
+            return
+        entry = pending.get(path)
+        if entry is None:
+            pending[path] = [deadline, None]
+        else:
+            entry[0] = deadline
+    
+    def _queue_tree(self, watcher, root, pending, deadline):
+        """Watch a directory (and, when recursive, its subdirectories) and queue every file in it."""
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            self._add_watch(watcher, directory)
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if not entry.is_dir():
+                            self._queue_file(directory / entry.name, pending, deadline)
+                        elif self.recursive and entry.name not in self.category_names and not entry.is_symlink():
+                            stack.append(directory / entry.name)
+            except OSError as e:
+                self.logger.error(f"Error reading directory {directory}: {str(e)}")
+    
+    def _check_settled(self, path, pending, now, settle):
+        """Move a pending file if it stopped changing, else check it again later."""
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            # Renamed or deleted before it settled
+            del pending[path]
+            return
+        except OSError as e:
+            self.logger.error(f"Error checking {path}: {str(e)}")
+            self._increment_stat("errors")
+            del pending[path]
+            return
+        
+        entry = pending[path]
+        signature = (st.st_size, st.st_mtime_ns)
+        if signature != entry[1] and time.time() - st.st_mtime < settle:
+            # Written to recently; give the writer another settle period
+            entry[0] = now + settle
+            entry[1] = signature
+            return
+        
+        del pending[path]
+        self._increment_stat("total_files")
+        self._submit(self._organize_file, path.parent, path.name, lambda: st)
+    
+    def _start_workers(self):
+        if self.workers > 1:
+            # Slow (e.g. network) filesystems are kept busy with several moves in flight;
+            # the semaphore bounds queued moves so huge trees don't pile up in memory
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            self._pending = threading.BoundedSemaphore(self.workers * 4)
+    
+    def _stop_workers(self):
+        """Wait for queued moves and save the sniff cache."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self.sniffer is not None:
+            try:
+                self.sniffer.save()
+            except OSError as e:
+                self.logger.warning(f"Could not save sniff cache: {str(e)}")
+    
+    def _log_stats(self):
+        self.logger.info(f"Total files: {self.stats['total_files']}")
+        self.logger.info(f"Moved files: {self.stats['moved_files']}")
+        self.logger.info(f"Skipped files: {self.stats['skipped_files']}")
+        if self.dedupe:
+            self.logger.info(f"Duplicates: {self.stats['duplicates']}")
+        if self.transfers.files:
+            self.logger.info(f"Copied across filesystems: {self.transfers.files} files, "
+                             f"{_format_bytes(self.transfers.bytes)} at {_format_bytes(self.transfers.rate())}/s")
+        self.logger.info(f"Errors: {self.stats['errors']}")
+        if self.sniffer is not None:
+            self.logger.info(f"Content sniffed: {self.sniffer.lookups} files ({self.sniffer.hits} from cache)")
+    
+    def _scan_tree(self, root, on_directory=None):
+        """Yield the files to organize in a directory and, when recursive, below it.
+        
+        Each directory is read once with os.scandir. File and directory
+        types come from the listing itself (d_type), so entries are not
+        stat-ed one by one. Uses an explicit stack instead of recursion, so
+        trees of any depth are safe.
+        
+        Args:
+            root (Path): The top directory to organize
+            on_directory (callable): Called with each directory before it is read
+            
+        Yields:
+            tuple: (directory, name, stat callable) per file
+        """
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            if on_directory is not None:
+                on_directory(directory)
+            self.logger.info(f"Processing directory: {directory}")
+            subdirectories = []
+            
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir():
+                            # Skip the category folders we're creating; don't follow
+                            # directory symlinks, which could loop
+                            if entry.name not in self.category_names and not entry.is_symlink():
+                                subdirectories.append(directory / entry.name)
+                            continue
+                        
+                        # Skip hidden files
+                        if entry.name.startswith('.'):
+                            continue
+                        
+                        self._increment_stat("total_files")
+                        yield directory, entry.name, entry.stat
+            except OSError as e:
+                self.logger.error(f"Error reading directory {directory}: {str(e)}")
+                self._increment_stat("errors")
+            
+            if self.recursive:
+                # Reversed so subdirectories are visited in listing order
+                stack.extend(reversed(subdirectories))
+    
+    def _submit(self, function, *args):
+        """Run function(*args) on the worker pool, or right away without one.
+        
+        Returns:
+            Future: The result of the call
+        """
+        if self._executor is None:
+            future = Future()
+            future.set_result(function(*args))
+            return future
+        
+        # Blocks while the pool already has enough work queued
+        self._pending.acquire()
+        future = self._executor.submit(function, *args)
+        future.add_done_callback(lambda f: self._pending.release())
+        return future
+    
+    def _increment_stat(self, key, amount=1):
+        """Add to one of the statistics; safe to call from worker threads."""
+        with self._stats_lock:
+            self.stats[key] += amount
+    
+    def _ensure_dir(self, path):
+        """Create a category directory once, even when several workers need it at the same time."""
+        with self._dirs_lock:
+            if path in self._created_dirs:
+                return
+            path.mkdir(exist_ok=True)
+            self._created_dirs.add(path)
+    
+    def _forget_dir(self, path):
+        """Forget that a category directory was created and what it held, e.g. after it was removed."""
+        with self._dirs_lock:
+            self._created_dirs.discard(path)
+        self.destinations.forget(path)
+    
+    def _organize_file(self, directory, name, stat):
+        """Move one file into its category folder right away (used by watch mode).
+        
+        Args:
+            directory (Path): The directory being organized
+            name (str): The name of the file to move
+            stat (callable): Returns the file's os.stat_result
+        """
+        move = self._plan_file(directory, name, stat)
+        if move is not None:
+            self._move(*move)
+    
+    def _plan_file(self, directory, name, stat):
+        """Decide where one file goes.
+        
+        Args:
+            directory (Path): The directory being organized
+            name (str): The name of the file to move
+            stat (callable): Returns the file's os.stat_result (e.g. DirEntry.stat, cached by os.scandir)
+            
+        Returns:
+            tuple: (source, destination, category), or None if the file stays
+        """
+        item = directory / name
+        try:
+            # Get the file category; the stat is only read by
+            # rules with size/age conditions, and the content only when the
+            # name alone can't decide
+            sniff = None
+            if self.sniffer is not None:
+                sniff = lambda: self.sniffer.sniff(item, stat())
+            category = self.rules.classify(name, stat, sniff, self.sniff_all)
+            
+            # Skip if category is 'other' and we don't want to create that folder
+            if category == self.rules.default and not self.create_other_folder:
+                self.logger.info(f"Skipping unknown type file: {item.name}")
+                self._increment_stat("skipped_files")
+                return None
+            
+            # Create the destination path, renaming on conflicts
+            category_dir = directory / category
+            new_name = self.destinations.reserve(category_dir, item.name)
+            if new_name != item.name:
+                self.logger.warning(f"File already exists, renaming to: {new_name}")
+            
+            return item, category_dir / new_name, category
+            
+        except Exception as e:
+            self.logger.error(f"Error processing {item.name}: {str(e)}")
+            self._increment_stat("errors")
+            return None
+    
+    def _move_journaled(self, source, dest, category, journal):
+        """Move one file, recording in the journal where it went if not to dest.
+        
+        The record is synced before this returns, so a run killed in the
+        middle of a batch can still be undone.
+        
+        Returns:
+            Path: Where the file was moved, or None if it wasn't
+        """
+        result = self._move(source, dest, category)
+        if journal is not None and result not in (None, dest):
+            journal.renamed(source, result)
+        return result
+    
+    def _move(self, source, dest, category):
+        """Move one file to its planned destination.
+        
+        The move never replaces an existing file: if another process took
+        the name since it was planned, the next free name is used.
+        
+        Returns:
+            Path: Where the file was moved, or None if it wasn't
+        """
+        try:
+            # Create the category directory if it doesn't exist
+            self._ensure_dir(dest.parent)
+            
+            # Move the file
+            retried = False
+            while True:
+                try:
+                    try:
+                        move_noreplace(source, dest)
+                    except OSError as e:
+                        if e.errno != errno.EXDEV:
+                            raise
+                        # The category folder is on another filesystem (e.g. a symlink to another disk)
+                        move_across_devices(source, dest, self.transfers)
+                    break
+                except FileExistsError:
+                    dest = dest.parent / self.destinations.reserve(dest.parent, dest.name)
+                    self.logger.warning(f"File already exists, renaming to: {dest.name}")
+                except FileNotFoundError:
+                    if retried or dest.parent.is_dir():
+                        raise
+                    # The category folder was removed since it was created (e.g. while watching)
+                    retried = True
+                    self._forget_dir(dest.parent)
+                    self._ensure_dir(dest.parent)
+                    dest = dest.parent / self.destinations.reserve(dest.parent, dest.name)
+            
+            self.logger.info(f"Moved: {source.name} -> {category}/{dest.name}")
+            self._increment_stat("moved_files")
+            return dest
+            
+        except Exception as e:
+            self.logger.error(f"Error processing {source.name}: {str(e)}")
+            self._increment_stat("errors")
+            return None
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
 
 
 def main():
@@ -177,18 +2007,50 @@ def main():
     parser.add_argument("directory", nargs="?", default=".", help="Directory to organize (default: current directory)")
     parser.add_argument("-r", "--recursive", action="store_true", help="Process subdirectories recursively")
     parser.add_argument("--no-other", action="store_true", help="Don't create 'other' folder for unmatched files")
+    parser.add_argument("--rules", metavar="FILE", help="JSON or TOML file with extra extensions and classification rules")
+    parser.add_argument("--sniff", nargs="?", const="unknown", choices=("unknown", "all"), help="Detect file types from their content: for files with no or an unknown extension (default), or 'all' files")
+    parser.add_argument("--sniff-cache", metavar="FILE", default=str(Path.home() / ".cache" / "file-organizer" / "sniff-cache.json"), help="Where sniffed types are remembered between runs (default: ~/.cache/file-organizer/sniff-cache.json)")
+    parser.add_argument("--watch", action="store_true", help="Keep running and organize new files as they arrive (inotify, or polling where unavailable)")
+    parser.add_argument("--settle", type=float, default=WATCH_SETTLE_SECONDS, help=f"Watch mode: seconds a new file must stay unchanged before it is moved (default: {WATCH_SETTLE_SECONDS:g})")
+    parser.add_argument("--poll", type=float, metavar="SECONDS", help="Watch mode: poll every SECONDS instead of using inotify")
+    parser.add_argument("--report-interval", type=float, default=WATCH_REPORT_SECONDS, help=f"Watch mode: seconds between statistics reports, 0 = only at exit (default: {WATCH_REPORT_SECONDS:g})")
+    parser.add_argument("--dedupe", choices=("skip", "hardlink", "report"), help="Find files whose content is already organized or planned: skip them, move them as hard links, or only report them")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="Show the planned moves without moving anything")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run, keeping it one run in the journal")
+    parser.add_argument("--undo", action="store_true", help="Move the files of the last run back to where they were")
+    parser.add_argument("--journal", metavar="FILE", help=f"Journal of moves used by --resume and --undo (default: {JOURNAL_NAME} in the directory)")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Number of files to move concurrently, e.g. 16 on network shares (default: 1)")
     args = parser.parse_args()
     
+    rules = None
+    if args.rules:
+        try:
+            rules = ClassificationRules.from_config(load_rules_file(args.rules), FileOrganizer.EXTENSION_MAP)
+        except (OSError, ValueError) as e:
+            parser.error(f"cannot load rules file {args.rules}: {str(e)}")
+    
     logger = setup_logger()
     
     organizer = FileOrganizer(
         directory=args.directory,
         logger=logger,
         create_other_folder=not args.no_other,
-        recursive=args.recursive
+        recursive=args.recursive,
+        workers=args.workers,
+        rules=rules,
+        sniffer=ContentSniffer(args.sniff_cache) if args.sniff else None,
+        sniff_all=args.sniff == "all",
+        dedupe=args.dedupe
     )
     
-    organizer.organize()
+    if args.undo:
+        organizer.undo(args.journal)
+    elif args.watch:
+        # Stop cleanly (finishing queued moves, reporting stats) when a service manager stops us
+        signal.signal(signal.SIGTERM, _interrupt)
+        organizer.watch(args.settle, args.report_interval, args.poll)
+    else:
+        organizer.organize(args.dry_run, args.journal, args.resume)
 
 
 if __name__ == "__main__":